@@ -0,0 +1,176 @@
+"""Per-route-group admission control with bounded queues."""
+
+import asyncio
+import bisect
+import contextlib
+import functools
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Tuple
+
+from fastapi import BackgroundTasks, HTTPException
+from fastapi.responses import StreamingResponse
+
+from .settings import ADMISSION_LIMITS, ADMISSION_QUEUE_TIMEOUT
+
+DEFAULT_ADMISSION_LIMITS = {
+    "comparison": (4, 16),
+    "uptime": (8, 32),
+    "archive": (16, 64),
+}
+QUEUE_TIME_BUCKETS = (0.001, 0.01, 0.1, 1.0)
+
+
+class AdmissionGate:
+    """Concurrency limit with a bounded wait queue for one group of routes.
+
+    Requests beyond the limit wait in the queue; a full queue is rejected at
+    once with 429 and a wait longer than ADMISSION_QUEUE_TIMEOUT with 503.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+        self.queue_time_buckets = [0] * (len(QUEUE_TIME_BUCKETS) + 1)
+
+    @contextlib.asynccontextmanager
+    async def admit(self) -> Any:
+        started = time.perf_counter()
+        if not self.semaphore.locked():
+            # An uncontended acquire completes without suspending.
+            await self.semaphore.acquire()
+        elif self.queued >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests for this endpoint, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        else:
+            self.queued += 1
+            try:
+                await asyncio.wait_for(
+                    self.semaphore.acquire(), ADMISSION_QUEUE_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Server is busy, try again shortly",
+                    headers={"Retry-After": "1"},
+                )
+            finally:
+                self.queued -= 1
+
+        queue_time = time.perf_counter() - started
+        self.admitted += 1
+        self.queue_time_total += queue_time
+        self.queue_time_max = max(self.queue_time_max, queue_time)
+        self.queue_time_buckets[bisect.bisect_left(QUEUE_TIME_BUCKETS, queue_time)] += 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.semaphore.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        buckets = {
+            f"le_{bound}": count
+            for bound, count in zip(QUEUE_TIME_BUCKETS, self.queue_time_buckets)
+        }
+        buckets["gt_" + str(QUEUE_TIME_BUCKETS[-1])] = self.queue_time_buckets[-1]
+        return {
+            "limit": self.limit,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "queue_time_seconds": {
+                "total": self.queue_time_total,
+                "max": self.queue_time_max,
+                "buckets": buckets,
+            },
+        }
+
+
+def parse_admission_limits(spec: str) -> Dict[str, Tuple[int, int]]:
+    """Parses "group=concurrency:queue,..." over the default limits."""
+    limits = dict(DEFAULT_ADMISSION_LIMITS)
+    for item in filter(None, (item.strip() for item in spec.split(","))):
+        name, _, values = item.partition("=")
+        concurrency, _, max_queue = values.partition(":")
+        limits[name.strip()] = (int(concurrency), int(max_queue or 0))
+    return limits
+
+
+admission_gates = {
+    name: AdmissionGate(name, limit, max_queue)
+    for name, (limit, max_queue) in parse_admission_limits(ADMISSION_LIMITS).items()
+}
+
+
+def hold_until_streamed(
+    response: StreamingResponse, slot: contextlib.AsyncExitStack
+) -> None:
+    """Keeps an admission slot until the response body has been sent.
+
+    The body iterator releases it when it finishes or is closed; the
+    background task covers a response that is never iterated, such as one
+    whose client disconnected first.
+    """
+    released = False
+
+    async def release() -> None:
+        nonlocal released
+        if not released:
+            released = True
+            await slot.aclose()
+
+    body = response.body_iterator
+
+    async def body_with_slot() -> AsyncIterator[Any]:
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            await release()
+
+    background = response.background
+    tasks = BackgroundTasks()
+    if background is not None:
+        tasks.add_task(background)
+    tasks.add_task(release)
+    response.body_iterator = body_with_slot()
+    response.background = tasks
+
+
+def admission(group: str) -> Callable:
+    """Puts a route handler behind the admission gate of `group`."""
+    gate = admission_gates[group]
+
+    def decorator(handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            async with contextlib.AsyncExitStack() as stack:
+                await stack.enter_async_context(gate.admit())
+                response = await handler(*args, **kwargs)
+                if isinstance(response, StreamingResponse):
+                    # A streamed body is produced after the handler returns.
+                    hold_until_streamed(response, stack.pop_all())
+                return response
+
+        return wrapper
+
+    return decorator
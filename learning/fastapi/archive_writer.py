@@ -0,0 +1,197 @@
+"""Append-only writer for the monthly archives served by main.py.
+
+An archive month is an NDJSON data file holding one snapshot object
+({"timestamp": ..., "data": ...}) per line, plus a sidecar index next to it:
+
+    xp_lb_archive/xp_lb_09_2024.ndjson
+    xp_lb_archive/xp_lb_09_2024.ndjson.idx
+
+The sidecar is JSON with the committed length of the data file, the byte
+range of every snapshot and the per-day hour coverage:
+
+    {"version": 1, "length": 1234,
+     "entries": [[timestamp, start, end], ...],
+     "coverage": {"2024-09-01": <24-bit mask of UTC hours>, ...}}
+
+Only the first `length` bytes of the data file are committed. A writer
+appends its lines, syncs them, then publishes a new sidecar with a rename,
+so readers see either the old or the new set of snapshots and never a
+partial line. A torn tail left by a crashed writer is cut off by the next
+append. When both exist, the API reads the NDJSON month instead of the JSON
+array of the same name.
+
+Writers of one month take turns on a lock file named after the month's
+path. Lock files live in ARCHIVE_LOCK_DIR, a directory private to the user,
+not in the data tree, so writers of one archive have to run as the same user.
+
+    python archive_writer.py append xp_lb_archive/xp_lb_09_2024.ndjson < snapshot.json
+    python archive_writer.py convert xp_lb_archive/xp_lb_09_2024.json
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from stat import S_ISDIR
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+SIDECAR_VERSION = 1
+SIDECAR_SUFFIX = ".idx"
+ARCHIVE_LOCK_DIR = os.getenv(
+    "ARCHIVE_LOCK_DIR",
+    os.path.join(tempfile.gettempdir(), f"archive_writer_locks-{os.getuid()}"),
+)
+
+
+def sidecar_path(path: Path) -> Path:
+    return path.with_name(path.name + SIDECAR_SUFFIX)
+
+
+def read_sidecar(path: Path) -> Dict[str, Any]:
+    """Committed state of the archive at `path`, empty if nothing was written."""
+    try:
+        with open(sidecar_path(path), "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+    except FileNotFoundError:
+        return {"version": SIDECAR_VERSION, "length": 0, "entries": [], "coverage": {}}
+    if sidecar.get("version") != SIDECAR_VERSION:
+        raise ValueError(
+            f"Unsupported archive sidecar version {sidecar.get('version')}"
+        )
+    return sidecar
+
+
+def _write_sidecar(path: Path, sidecar: Dict[str, Any]) -> None:
+    target = sidecar_path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(sidecar, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    dir_fd = os.open(target.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def lock_path(path: Path) -> Path:
+    """Lock file of the archive at `path`, shared by every name for the file."""
+    lock_dir = Path(ARCHIVE_LOCK_DIR)
+    lock_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+    stat = lock_dir.lstat()
+    # Someone else's directory could hold a lock that is never released.
+    if not S_ISDIR(stat.st_mode) or stat.st_uid != os.getuid() or stat.st_mode & 0o022:
+        raise OSError(f"Archive lock directory {lock_dir} is not private")
+    key = hashlib.sha256(str(path.resolve()).encode()).hexdigest()[:32]
+    return lock_dir / f"{key}.lock"
+
+
+@contextmanager
+def _locked(path: Path) -> Iterator[None]:
+    with open(lock_path(path), "ab") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+class ArchiveWriter:
+    """Appends snapshots to one NDJSON archive month."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def append(self, timestamp: float, data: Any) -> None:
+        self.extend([(timestamp, data)])
+
+    def extend(self, snapshots: Iterable[Tuple[float, Any]]) -> None:
+        """Appends snapshots and commits them with a single sidecar swap."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with _locked(self.path):
+            sidecar = read_sidecar(self.path)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                # Drop anything past the committed length, such as a torn
+                # line from a writer that died before publishing its sidecar.
+                os.ftruncate(fd, sidecar["length"])
+                os.lseek(fd, sidecar["length"], os.SEEK_SET)
+                position = sidecar["length"]
+                chunks = []
+                for timestamp, data in snapshots:
+                    line = json.dumps({"timestamp": timestamp, "data": data}) + "\n"
+                    encoded = line.encode("utf-8")
+                    # The range excludes the newline, like a JSON array entry.
+                    sidecar["entries"].append(
+                        [timestamp, position, position + len(encoded) - 1]
+                    )
+                    dt = datetime.fromtimestamp(timestamp, timezone.utc)
+                    day = dt.date().isoformat()
+                    sidecar["coverage"][day] = sidecar["coverage"].get(day, 0) | (
+                        1 << dt.hour
+                    )
+                    position += len(encoded)
+                    chunks.append(encoded)
+                if not chunks:
+                    return
+                os.write(fd, b"".join(chunks))
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+            sidecar["length"] = position
+            _write_sidecar(self.path, sidecar)
+
+
+def convert(json_path: Path) -> Path:
+    """Rewrites a JSON array archive as an NDJSON month next to it."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    ndjson_path = json_path.with_suffix(".ndjson")
+    if read_sidecar(ndjson_path)["entries"]:
+        raise FileExistsError(f"{ndjson_path} already has snapshots")
+    ArchiveWriter(ndjson_path).extend(
+        (entry.get("timestamp", 0), entry.get("data")) for entry in entries
+    )
+    return ndjson_path
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Append to NDJSON archives")
+    commands = parser.add_subparsers(dest="command", required=True)
+    append = commands.add_parser(
+        "append", help="append snapshots read from stdin, one JSON object per line"
+    )
+    append.add_argument("archive", type=Path)
+    to_ndjson = commands.add_parser(
+        "convert", help="convert a JSON array archive to NDJSON"
+    )
+    to_ndjson.add_argument("archive", type=Path)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        print(convert(args.archive))
+        return 0
+
+    snapshots = []
+    for line in sys.stdin:
+        if line.strip():
+            entry = json.loads(line)
+            snapshots.append((entry["timestamp"], entry["data"]))
+    ArchiveWriter(args.archive).extend(snapshots)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,488 @@
+"""Monthly leaderboard and quest archives, their indexes and coverage."""
+
+import asyncio
+import bisect
+import json
+from array import array
+from collections.abc import Sequence
+from datetime import date, datetime, timezone
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, Awaitable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .datasets import load_dataset, load_dataset_sync, run_cpu_heavy
+from .generation import get_player_countries
+from .models import LevelInfo
+from .settings import STORAGE_PATH
+from .shared_cache import attach_shared_tables, shared_dataset_name, shared_table_path
+from .sources import (
+    BLITZ_LEADERBOARD_COLUMNS,
+    MONTHLY_LEADERBOARD_COLUMNS,
+    XP_LEADERBOARD_COLUMNS,
+    parse_json_file,
+    parse_level_names,
+    read_archive_entries,
+    read_archive_sidecar,
+    resolve_archive_path,
+)
+from .tables import ColumnTable, CountryGroups
+
+
+def load_country_groups(
+    dataset: str,
+    path: Path,
+    countries: Iterable[str],
+    depends_on: Tuple[Path, ...] = (),
+) -> Awaitable[CountryGroups]:
+    """Groups rows of a dataset by country once per generation of `path`."""
+    return load_dataset(
+        f"countries:{dataset}",
+        path,
+        lambda _: CountryGroups(countries),
+        depends_on=depends_on,
+    )
+
+
+def closest_position(timestamps: Sequence[float], timestamp: float) -> Optional[int]:
+    """Position of the sorted timestamp nearest to `timestamp`, None if empty."""
+    position = bisect.bisect_left(timestamps, timestamp)
+    candidates = [
+        index for index in (position - 1, position) if 0 <= index < len(timestamps)
+    ]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda index: abs(timestamps[index] - timestamp))
+
+
+def first_position_between(
+    timestamps: Sequence[float], start_ts: float, end_ts: float
+) -> Optional[int]:
+    """Position of the first sorted timestamp in [start_ts, end_ts), or None."""
+    position = bisect.bisect_left(timestamps, start_ts)
+    if position < len(timestamps) and timestamps[position] < end_ts:
+        return position
+    return None
+
+
+class LeaderboardArchive:
+    """Snapshots of a leaderboard archive as compact tables, sorted by timestamp.
+
+    The snapshots are consecutive slices of one table mapped from the shared
+    cache, so uuids, names and countries that repeat from snapshot to snapshot
+    are stored once.
+    """
+
+    __slots__ = ("timestamps", "starts", "ends", "rows", "snapshots")
+
+    def __init__(self, tables: Dict[str, ColumnTable]):
+        index, self.rows = tables["snapshots"], tables["rows"]
+        self.timestamps = index["timestamp"]
+        self.starts = index["start"]
+        self.ends = index["end"]
+        self.snapshots = [
+            self.rows.slice(start, end) for start, end in zip(self.starts, self.ends)
+        ]
+
+    def __len__(self) -> int:
+        return len(self.snapshots)
+
+    def latest(self) -> Tuple[float, ColumnTable]:
+        return self.timestamps[-1], self.snapshots[-1]
+
+    def closest_index(self, timestamp: float) -> int:
+        return closest_position(self.timestamps, timestamp)
+
+    def closest(self, timestamp: float) -> Tuple[float, ColumnTable]:
+        index = self.closest_index(timestamp)
+        return self.timestamps[index], self.snapshots[index]
+
+
+def build_leaderboard_archive_tables(
+    path: Path, kinds: Dict[str, str]
+) -> Tuple[Dict, Dict]:
+    """Flattens every snapshot into one table of rows plus a snapshot index."""
+    entries = sorted(read_archive_entries(path), key=lambda x: x.get("timestamp", 0))
+    columns: Dict[str, List[Any]] = {name: [] for name in kinds}
+    snapshots: Dict[str, List[Any]] = {"timestamp": [], "start": [], "end": []}
+    row_count = 0
+    for entry in entries:
+        snapshots["timestamp"].append(float(entry.get("timestamp", 0)))
+        snapshots["start"].append(row_count)
+        for row in entry.get("data", []):
+            for name, kind in kinds.items():
+                value = row[name]
+                if kind == "q":
+                    value = int(value)
+                elif kind == "d":
+                    value = float(value)
+                columns[name].append(value)
+            row_count += 1
+        snapshots["end"].append(row_count)
+
+    tables = {
+        "snapshots": {
+            "timestamp": ("d", snapshots["timestamp"]),
+            "start": ("q", snapshots["start"]),
+            "end": ("q", snapshots["end"]),
+        },
+        "rows": {name: (kinds[name], values) for name, values in columns.items()},
+    }
+    return tables, {}
+
+
+def load_leaderboard_archive_snapshot(
+    path: Path, kinds: Dict[str, str]
+) -> LeaderboardArchive:
+    _, tables = attach_shared_tables(
+        shared_dataset_name("archive", path),
+        path,
+        lambda path: build_leaderboard_archive_tables(path, kinds),
+    )
+    return LeaderboardArchive(tables)
+
+
+async def load_leaderboard_archive(
+    archive_path: Path, kinds: Dict[str, str]
+) -> LeaderboardArchive:
+    dataset = f"archive:{archive_path.relative_to(STORAGE_PATH)}"
+    return await load_dataset(
+        dataset,
+        archive_path,
+        lambda path: load_leaderboard_archive_snapshot(path, kinds),
+    )
+
+
+async def load_archive_country_groups(
+    archive_path: Path, archive: LeaderboardArchive
+) -> CountryGroups:
+    """Country groups over every snapshot of an archive.
+
+    Archives without a country column take each player's country from their
+    most recent score, so they also depend on score_data.csv.
+    """
+    dataset = f"archive:{archive_path.relative_to(STORAGE_PATH)}"
+    if "country" in archive.rows.columns:
+        return await load_country_groups(dataset, archive_path, archive.rows["country"])
+
+    score_data_path = Path(STORAGE_PATH) / "github_data/score_data.csv"
+    player_countries = await get_player_countries()
+    return await load_country_groups(
+        dataset,
+        archive_path,
+        (player_countries.get(acc, "") for acc in archive.rows["acc"]),
+        depends_on=(score_data_path,),
+    )
+
+
+async def archive_snapshot_rows(
+    archive_path: Path,
+    archive: LeaderboardArchive,
+    index: int,
+    country: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Rows of one snapshot, optionally only those of `country`."""
+    if country is None:
+        return archive.snapshots[index].rows()
+    groups = await load_archive_country_groups(archive_path, archive)
+    return archive.rows.rows(
+        groups.rows(country.upper(), archive.starts[index], archive.ends[index])
+    )
+
+
+class ArchiveIndex:
+    """Byte ranges of the entries of a JSON array archive, sorted by timestamp.
+
+    Lets a route decode a single entry instead of the whole archive.
+    """
+
+    __slots__ = ("path", "timestamps", "starts", "ends")
+
+    def __init__(self, path: Path, entries: ColumnTable):
+        self.path = path
+        self.timestamps = entries["timestamp"]
+        self.starts = entries["start"]
+        self.ends = entries["end"]
+
+    @classmethod
+    def empty(cls, path: Path) -> "ArchiveIndex":
+        """Index of an archive that does not exist yet."""
+        return cls(path, ColumnTable(0, {"timestamp": (), "start": (), "end": ()}))
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def first_between(self, start_ts: float, end_ts: float) -> Optional[int]:
+        return first_position_between(self.timestamps, start_ts, end_ts)
+
+    def read_entry(self, position: int) -> Dict[str, Any]:
+        with open(self.path, "rb") as f:
+            f.seek(self.starts[position])
+            return json.loads(f.read(self.ends[position] - self.starts[position]))
+
+
+def scan_json_array_entries(path: Path) -> List[Tuple[float, int, int]]:
+    """(timestamp, start, end) of each entry of a JSON array archive."""
+    with open(path, "rb") as f:
+        data = f.read()
+    text = data.decode("utf-8")
+    is_ascii = len(text) == len(data)
+
+    decoder = json.JSONDecoder()
+    entries = []
+    byte_position, char_position = 0, 0
+
+    def to_byte_offset(offset: int) -> int:
+        nonlocal byte_position, char_position
+        if is_ascii:
+            return offset
+        byte_position += len(text[char_position:offset].encode("utf-8"))
+        char_position = offset
+        return byte_position
+
+    position = text.index("[") + 1
+    while True:
+        while text[position] in " \t\r\n,":
+            position += 1
+        if text[position] == "]":
+            break
+        entry, end = decoder.raw_decode(text, position)
+        entries.append(
+            (entry.get("timestamp", 0), to_byte_offset(position), to_byte_offset(end))
+        )
+        position = end
+    return entries
+
+
+def build_archive_index_tables(path: Path) -> Tuple[Dict, Dict]:
+    if path.suffix == ".ndjson":
+        entries = [tuple(entry) for entry in read_archive_sidecar(path)["entries"]]
+    else:
+        entries = scan_json_array_entries(path)
+    entries.sort(key=lambda x: x[0])
+
+    tables = {
+        "entries": {
+            "timestamp": ("d", [float(entry[0]) for entry in entries]),
+            "start": ("q", [entry[1] for entry in entries]),
+            "end": ("q", [entry[2] for entry in entries]),
+        }
+    }
+    return tables, {}
+
+
+def build_archive_index(path: Path) -> ArchiveIndex:
+    _, tables = attach_shared_tables(
+        shared_dataset_name("archive_index", path), path, build_archive_index_tables
+    )
+    return ArchiveIndex(path, tables["entries"])
+
+
+async def load_archive_index(archive_path: Path) -> ArchiveIndex:
+    dataset = f"archive_index:{archive_path.relative_to(STORAGE_PATH)}"
+    return await load_dataset(dataset, archive_path, build_archive_index)
+
+
+class LevelsArchiveIndex:
+    """levels_archive.json sorted by timestamp, with level names resolved."""
+
+    __slots__ = ("timestamps", "entries")
+
+    def __init__(self, entries: List[Tuple[float, List[str], List[LevelInfo]]]):
+        self.entries = sorted(entries, key=lambda x: x[0])
+        self.timestamps = array("d", (entry[0] for entry in self.entries))
+
+    def closest(
+        self, timestamp: float
+    ) -> Optional[Tuple[float, List[str], List[LevelInfo]]]:
+        position = closest_position(self.timestamps, timestamp)
+        return None if position is None else self.entries[position]
+
+    def first_between(
+        self, start_ts: float, end_ts: float
+    ) -> Optional[Tuple[float, List[str], List[LevelInfo]]]:
+        position = first_position_between(self.timestamps, start_ts, end_ts)
+        return None if position is None else self.entries[position]
+
+
+def build_levels_archive_index(path: Path) -> LevelsArchiveIndex:
+    level_data_path = Path(STORAGE_PATH) / "github_data/level_data.csv"
+    level_name_map = (
+        parse_level_names(level_data_path) if level_data_path.exists() else {}
+    )
+
+    entries = []
+    for entry in parse_json_file(path):
+        level_uuids = entry.get("levels", [])
+        levels = [
+            LevelInfo(uuid=uuid, name=level_name_map.get(uuid, uuid))
+            for uuid in level_uuids
+        ]
+        entries.append((entry.get("timestamp", 0), level_uuids, levels))
+    return LevelsArchiveIndex(entries)
+
+
+async def load_levels_archive_index(path: Path) -> LevelsArchiveIndex:
+    level_data_path = Path(STORAGE_PATH) / "github_data/level_data.csv"
+    return await load_dataset(
+        "levels_archive_index",
+        path,
+        build_levels_archive_index,
+        depends_on=(level_data_path,),
+    )
+
+
+def parse_archive_timestamps(path: Path) -> array:
+    return array("d", (entry.get("timestamp", 0) for entry in parse_json_file(path)))
+
+
+UPTIME_ARCHIVES = {
+    "xp_leaderboard": "xp_lb_archive/xp_lb_{month:02d}_{year}.json",
+    "blitz_leaderboard": "blitz_lb_archive/blitz_lb_{month:02d}_{year}.json",
+    "quests": "quests_archive/quests_{month:02d}_{year}.json",
+}
+FULL_DAY_MASK = (1 << 24) - 1
+LEADERBOARD_ARCHIVES = {
+    "monthly_leaderboard": (
+        "monthly_lb_daily/archive/monthly_lb_{month:02d}_{year}.json",
+        MONTHLY_LEADERBOARD_COLUMNS,
+    ),
+    "xp_leaderboard": (
+        "xp_lb_archive/xp_lb_{month:02d}_{year}.json",
+        XP_LEADERBOARD_COLUMNS,
+    ),
+    "blitz_leaderboard": (
+        "blitz_lb_archive/blitz_lb_{month:02d}_{year}.json",
+        BLITZ_LEADERBOARD_COLUMNS,
+    ),
+}
+
+
+def build_coverage_tables(path: Path) -> Tuple[Dict, Dict]:
+    """Hours with data per UTC day of an archive, as 24-bit masks."""
+    coverage: Dict[int, int] = {}
+    if path.suffix == ".ndjson":
+        for day, mask in read_archive_sidecar(path)["coverage"].items():
+            coverage[date.fromisoformat(day).toordinal()] = mask
+    else:
+        for timestamp in parse_archive_timestamps(path):
+            dt = datetime.fromtimestamp(timestamp, timezone.utc)
+            day = dt.date().toordinal()
+            coverage[day] = coverage.get(day, 0) | (1 << dt.hour)
+    days = sorted(coverage)
+    tables = {
+        "days": {
+            "ordinal": ("q", days),
+            "mask": ("q", [coverage[day] for day in days]),
+        }
+    }
+    return tables, {}
+
+
+def attach_archive_coverage(archive_path: str) -> Dict[date, int]:
+    path = Path(archive_path)
+    _, tables = attach_shared_tables(
+        shared_dataset_name("coverage", path), path, build_coverage_tables
+    )
+    days = tables["days"]
+    return {
+        date.fromordinal(ordinal): mask
+        for ordinal, mask in zip(days["ordinal"], days["mask"])
+    }
+
+
+async def build_archive_coverage_in_pool(path: Path) -> Dict[date, int]:
+    """Maps a persisted coverage summary, building it in the pool if missing."""
+    if shared_table_path(shared_dataset_name("coverage", path), path).exists():
+        return await asyncio.to_thread(attach_archive_coverage, str(path))
+    return await run_cpu_heavy(attach_archive_coverage, str(path))
+
+
+async def load_archive_coverage(archive_path: Path) -> Dict[date, int]:
+    """Coverage summary of an archive, computed once per archive generation."""
+    dataset = f"coverage:{archive_path.relative_to(STORAGE_PATH)}"
+    return await load_dataset(dataset, archive_path, build_archive_coverage_in_pool)
+
+
+async def load_board_archive(
+    board: str, timestamp: float
+) -> Tuple[Path, LeaderboardArchive]:
+    """Archive month of `board` that holds `timestamp`."""
+    dt = datetime.fromtimestamp(timestamp)
+    archive_template, kinds = LEADERBOARD_ARCHIVES[board]
+    archive_path = resolve_archive_path(
+        Path(STORAGE_PATH) / archive_template.format(year=dt.year, month=dt.month)
+    )
+
+    if not archive_path.exists():
+        raise HTTPException(
+            status_code=404, detail=f"No {board} archive found for {dt.month}/{dt.year}"
+        )
+
+    archive = await load_leaderboard_archive(archive_path, kinds)
+
+    if not archive:
+        raise HTTPException(status_code=404, detail="Archive is empty")
+
+    return archive_path, archive
+
+
+def snapshot_gains(
+    before: ColumnTable, after: ColumnTable, value_column: str
+) -> List[Tuple[int, int, int]]:
+    """Gain, row in `after` and previous value of every player in both snapshots.
+
+    Sorted by gain, largest first, ties in `after` order. Players missing from
+    `before` have no gain to report and are left out.
+    """
+    before_accs, after_accs = before["acc"], after["acc"]
+    before_values = before[value_column]
+    gains = []
+    if before_accs.values is after_accs.values:
+        # Snapshots of one archive share the column dictionary, so the join
+        # runs on the code arrays: a dense array indexed by code holds each
+        # player's row in `before`, plus one so that zero means absent.
+        positions = array("q", bytes(8 * len(before_accs.values)))
+        for row, code in enumerate(before_accs.codes):
+            positions[code] = row + 1
+        for row, (code, value) in enumerate(zip(after_accs.codes, after[value_column])):
+            position = positions[code]
+            if position:
+                previous = before_values[position - 1]
+                gains.append((value - previous, row, previous))
+    else:
+        previous = dict(zip(before_accs, before_values))
+        gains = [
+            (value - previous[acc], row, previous[acc])
+            for row, (acc, value) in enumerate(zip(after_accs, after[value_column]))
+            if acc in previous
+        ]
+    gains.sort(key=itemgetter(0), reverse=True)
+    return gains
+
+
+def snapshot_gains_task(
+    board: str,
+    value_column: str,
+    start_path: str,
+    start_timestamp: float,
+    end_path: str,
+    end_timestamp: float,
+) -> List[Tuple[int, int, int]]:
+    """`snapshot_gains` for a pool worker, which maps the archives itself."""
+    kinds = LEADERBOARD_ARCHIVES[board][1]
+
+    def snapshot(path: Path, timestamp: float) -> ColumnTable:
+        archive = load_dataset_sync(
+            f"archive:{path.relative_to(STORAGE_PATH)}",
+            path,
+            lambda path: load_leaderboard_archive_snapshot(path, kinds),
+        )
+        return archive.closest(timestamp)[1]
+
+    return snapshot_gains(
+        snapshot(Path(start_path), start_timestamp),
+        snapshot(Path(end_path), end_timestamp),
+        value_column,
+    )
@@ -0,0 +1,156 @@
+"""Parsed datasets cached per generation of their source files.
+
+Event-loop code loads datasets through `load_dataset`; CPU-heavy work runs
+in the bounded process pool behind `run_cpu_heavy`, whose workers keep
+their own cache through `load_dataset_sync`.
+"""
+
+import asyncio
+import concurrent.futures
+import multiprocessing
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .settings import CPU_POOL_QUEUE, CPU_POOL_WORKERS, DATASET_CACHE_SIZE
+from .sources import archive_sidecar_path
+
+WORKER_DATASET_CACHE_SIZE = 16
+
+_dataset_cache: "OrderedDict[str, Tuple[Any, Any]]" = OrderedDict()
+_inflight_loads: Dict[Tuple[str, Any], "asyncio.Future[Any]"] = {}
+
+
+def file_generation(path: Path) -> Optional[Tuple[int, int]]:
+    """Cheap fingerprint of a source file, changes whenever the file is rewritten."""
+    if path.suffix == ".ndjson":
+        # An NDJSON archive only changes when its sidecar commits new data.
+        path = archive_sidecar_path(path)
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def single_flight(
+    key: Tuple[str, Any], start: Callable[[], Awaitable[Any]]
+) -> "asyncio.Future[Any]":
+    """Awaits the in-flight task for `key`, starting it if there is none."""
+    inflight = _inflight_loads.get(key)
+    if inflight is None:
+        inflight = asyncio.ensure_future(start())
+        _inflight_loads[key] = inflight
+        inflight.add_done_callback(lambda _: _inflight_loads.pop(key, None))
+    return asyncio.shield(inflight)
+
+
+async def load_dataset(
+    dataset: str,
+    path: Path,
+    parser: Callable[[Path], Any],
+    depends_on: Tuple[Path, ...] = (),
+) -> Any:
+    """Returns the parsed dataset for the current file generation.
+
+    Concurrent misses for the same (dataset, generation) await a single
+    in-flight load instead of each parsing the file. Files the parser also
+    reads are listed in `depends_on` so that changes to them invalidate it.
+    """
+    generation = file_generation(path)
+    if depends_on:
+        generation = (generation, *map(file_generation, depends_on))
+    cached = _dataset_cache.get(dataset)
+    if cached is not None and cached[0] == generation:
+        _dataset_cache.move_to_end(dataset)
+        return cached[1]
+
+    return await single_flight(
+        (dataset, generation), lambda: _run_load(dataset, generation, path, parser)
+    )
+
+
+async def _run_load(
+    dataset: str, generation: Any, path: Path, parser: Callable[[Path], Any]
+) -> Any:
+    if asyncio.iscoroutinefunction(parser):
+        value = await parser(path)
+    else:
+        value = await asyncio.to_thread(parser, path)
+
+    _dataset_cache[dataset] = (generation, value)
+    _dataset_cache.move_to_end(dataset)
+    while len(_dataset_cache) > DATASET_CACHE_SIZE:
+        _dataset_cache.popitem(last=False)
+
+    return value
+
+
+_cpu_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+_cpu_inflight = 0
+# Datasets a pool worker keeps mapped, most recently used last.
+_worker_datasets: "OrderedDict[Tuple[str, Path], Tuple[Any, Any]]" = OrderedDict()
+
+
+async def run_cpu_heavy(func: Callable[..., Any], *args: Any) -> Any:
+    """Runs a CPU-heavy function in the bounded process pool.
+
+    Arguments should be handles such as file paths that the worker can map
+    itself, not large objects. When every worker is busy and the queue is
+    full the request is shed with a 503 instead of waiting. With
+    CPU_POOL_WORKERS=0 the function runs in a thread instead.
+    """
+    global _cpu_pool, _cpu_inflight
+
+    if CPU_POOL_WORKERS <= 0:
+        return await asyncio.to_thread(func, *args)
+
+    if _cpu_inflight >= CPU_POOL_WORKERS + CPU_POOL_QUEUE:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+    if _cpu_pool is None:
+        # Forked workers would inherit descriptors held by other threads at
+        # that moment, such as a shared-table build lock, and keep them open
+        # for their whole life. Forkserver children start from a clean process.
+        _cpu_pool = concurrent.futures.ProcessPoolExecutor(
+            CPU_POOL_WORKERS, mp_context=multiprocessing.get_context("forkserver")
+        )
+
+    _cpu_inflight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_cpu_pool, func, *args)
+    except concurrent.futures.process.BrokenProcessPool:
+        _cpu_pool = None
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    finally:
+        _cpu_inflight -= 1
+
+
+def load_dataset_sync(dataset: str, path: Path, parser: Callable[[Path], Any]) -> Any:
+    """`load_dataset` for code running inside a process-pool worker.
+
+    One entry is kept per dataset and path and replaced when the file
+    changes; beyond WORKER_DATASET_CACHE_SIZE entries the least recently
+    used is dropped, along with the maps it holds.
+    """
+    key = (dataset, path)
+    generation = file_generation(path)
+    cached = _worker_datasets.get(key)
+    if cached is None or cached[0] != generation:
+        # Drop the stale generation before parsing the new one.
+        _worker_datasets.pop(key, None)
+        cached = _worker_datasets[key] = (generation, parser(path))
+        while len(_worker_datasets) > WORKER_DATASET_CACHE_SIZE:
+            _worker_datasets.popitem(last=False)
+    _worker_datasets.move_to_end(key)
+    return cached[1]
@@ -0,0 +1,203 @@
+"""The current boards and the maps every route shares."""
+
+import asyncio
+import itertools
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .datasets import file_generation, load_dataset, single_flight
+from .indexes import (
+    PlayerChanges,
+    load_account_names,
+    load_player_changes,
+    load_player_countries,
+)
+from .settings import STORAGE_BACKEND, STORAGE_PATH
+from .sources import (
+    parse_level_names,
+    parse_level_uuids,
+    parse_metadata_timestamp,
+    parse_monthly_leaderboard,
+    parse_speedrun_leaderboard,
+)
+from .sqlite_store import (
+    load_sqlite_account_names,
+    load_sqlite_level_names,
+    load_sqlite_player_countries,
+)
+from .tables import CountryGroups
+
+
+async def get_player_name_map() -> Mapping:
+    account_data_path = Path(STORAGE_PATH) / "github_data/account_data.csv"
+    if not account_data_path.exists():
+        return {}
+    loader = (
+        load_sqlite_account_names if STORAGE_BACKEND == "sqlite" else load_account_names
+    )
+    return await load_dataset("account_names", account_data_path, loader)
+
+
+async def get_level_name_map() -> Mapping:
+    level_data_path = Path(STORAGE_PATH) / "github_data/level_data.csv"
+    if not level_data_path.exists():
+        return {}
+    loader = (
+        load_sqlite_level_names if STORAGE_BACKEND == "sqlite" else parse_level_names
+    )
+    return await load_dataset("level_names", level_data_path, loader)
+
+
+async def get_player_countries() -> Mapping:
+    score_data_path = Path(STORAGE_PATH) / "github_data/score_data.csv"
+    if not score_data_path.exists():
+        return {}
+    loader = (
+        load_sqlite_player_countries
+        if STORAGE_BACKEND == "sqlite"
+        else load_player_countries
+    )
+    return await load_dataset("player_countries", score_data_path, loader)
+
+
+async def get_player_changes() -> PlayerChanges:
+    player_data_path = Path(STORAGE_PATH) / "player_data/player_changes.json"
+    if not player_data_path.exists():
+        return PlayerChanges({}, {})
+    return await load_dataset("player_changes", player_data_path, load_player_changes)
+
+
+GENERATION_SOURCES = {
+    "monthly_leaderboard": "monthly_lb_daily/leaderboard.csv",
+    "speedrun_leaderboard": "speedrun_lb_daily/leaderboard.csv",
+    "monthly_levels": "monthly_lb_monthly/levels.txt",
+    "level_names": "github_data/level_data.csv",
+    "player_names": "github_data/account_data.csv",
+    "metadata": "github_data/metadata.json",
+}
+GENERATION_BUILD_ATTEMPTS = 3
+
+
+class DatasetGeneration:
+    """Every dataset behind the current boards, parsed from one refresh.
+
+    A generation is never modified after it is published. Requests hold on
+    to the generation they started with, so a response never mixes files
+    from two refreshes, and a replaced generation is freed once the last
+    request using it finishes.
+    """
+
+    __slots__ = (
+        "fingerprint",
+        "monthly_leaderboard",
+        "monthly_countries",
+        "speedrun_leaderboard",
+        "speedrun_countries",
+        "monthly_levels",
+        "level_names",
+        "player_names",
+        "metadata_timestamp",
+    )
+
+    def __init__(self, fingerprint: Tuple, paths: Dict[str, Path]):
+        self.fingerprint = fingerprint
+        present = {name: path for name, path in paths.items() if path.exists()}
+        sqlite = STORAGE_BACKEND == "sqlite"
+
+        self.monthly_leaderboard = self.monthly_countries = None
+        if "monthly_leaderboard" in present:
+            self.monthly_leaderboard = parse_monthly_leaderboard(
+                present["monthly_leaderboard"]
+            )
+            self.monthly_countries = CountryGroups(self.monthly_leaderboard["country"])
+
+        self.speedrun_leaderboard = self.speedrun_countries = None
+        if "speedrun_leaderboard" in present:
+            self.speedrun_leaderboard = parse_speedrun_leaderboard(
+                present["speedrun_leaderboard"]
+            )
+            self.speedrun_countries = CountryGroups(
+                self.speedrun_leaderboard["country"]
+            )
+
+        self.monthly_levels: List[str] = []
+        if "monthly_levels" in present:
+            self.monthly_levels = parse_level_uuids(present["monthly_levels"])
+
+        self.level_names: Mapping = {}
+        if "level_names" in present:
+            self.level_names = (
+                load_sqlite_level_names(present["level_names"])
+                if sqlite
+                else parse_level_names(present["level_names"])
+            )
+
+        self.player_names: Mapping = {}
+        if "player_names" in present:
+            self.player_names = (
+                load_sqlite_account_names(present["player_names"])
+                if sqlite
+                else load_account_names(present["player_names"])
+            )
+
+        self.metadata_timestamp = 0.0
+        if "metadata" in present:
+            self.metadata_timestamp = parse_metadata_timestamp(present["metadata"])
+
+
+_generation: Optional[DatasetGeneration] = None
+_generation_sequence = 0
+_generation_builds = itertools.count(1)
+
+
+def generation_paths() -> Dict[str, Path]:
+    base_path = Path(STORAGE_PATH)
+    return {name: base_path / path for name, path in GENERATION_SOURCES.items()}
+
+
+def generation_fingerprint(paths: Dict[str, Path]) -> Tuple:
+    return tuple(file_generation(path) for path in paths.values())
+
+
+def build_generation(fingerprint: Tuple) -> DatasetGeneration:
+    """Parses a generation, retrying if a source changes while it is read."""
+    paths = generation_paths()
+    for _ in range(GENERATION_BUILD_ATTEMPTS):
+        generation = DatasetGeneration(fingerprint, paths)
+        current = generation_fingerprint(paths)
+        if current == fingerprint:
+            break
+        fingerprint = current
+    return generation
+
+
+async def publish_generation(fingerprint: Tuple, sequence: int) -> DatasetGeneration:
+    """Builds a generation and publishes it unless a later build already has.
+
+    Builds are numbered as they start, and a later build read the sources no
+    earlier than this one, so a slow build never replaces a newer generation.
+    """
+    global _generation, _generation_sequence
+
+    generation = await asyncio.to_thread(build_generation, fingerprint)
+    if sequence > _generation_sequence:
+        _generation, _generation_sequence = generation, sequence
+    return generation
+
+
+async def current_generation() -> DatasetGeneration:
+    """The published generation, replaced first if any source file changed.
+
+    Readers only take the module-level reference, so they never wait on a
+    lock; concurrent requests that see a change share a single rebuild.
+    """
+    fingerprint = generation_fingerprint(generation_paths())
+    generation = _generation
+    if generation is not None and generation.fingerprint == fingerprint:
+        return generation
+
+    return await single_flight(
+        ("generation", fingerprint),
+        lambda: publish_generation(fingerprint, next(_generation_builds)),
+    )
@@ -0,0 +1,566 @@
+"""Lookup indexes over the score, account and player-change data."""
+
+import bisect
+import itertools
+import math
+import unicodedata
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .datasets import load_dataset_sync
+from .shared_cache import attach_shared_tables, latest_shared_tables
+from .sources import (
+    CsvTailReader,
+    parse_account_names,
+    parse_json_file,
+    tail_checkpoint,
+)
+from .tables import ColumnTable, TableMap
+
+
+class ScoreIndex:
+    """Latest score per (player, level, value_type) on each level's newest version."""
+
+    def __init__(self):
+        self.level_versions: Dict[str, int] = {}
+        self.player_scores: Dict[str, Dict[Tuple[str, int], Dict[str, Any]]] = {}
+        self.level_players: Dict[str, set] = {}
+
+    @classmethod
+    def from_tables(cls, tables: Dict[str, ColumnTable]) -> "ScoreIndex":
+        index = cls()
+        levels = tables["levels"]
+        index.level_versions = dict(zip(levels["level_uuid"], levels["level_version"]))
+        for row in tables["scores"].rows():
+            player_uuid = row.pop("player_uuid")
+            key = (row.pop("level_uuid"), row.pop("value_type"))
+            index.player_scores.setdefault(player_uuid, {})[key] = row
+            index.level_players.setdefault(key[0], set()).add(player_uuid)
+        return index
+
+    def add_row(self, row: Dict[str, str]) -> None:
+        level_uuid = row["level_uuid"]
+        level_version = int(row["level_version"])
+
+        current_version = self.level_versions.get(level_uuid)
+        if current_version is not None and level_version < current_version:
+            return
+        if current_version is None or level_version > current_version:
+            self.level_versions[level_uuid] = level_version
+            if current_version is not None:
+                self._drop_level(level_uuid)
+
+        player_uuid = row["account_ids"]
+        value_type = int(row["value_type"])
+        timestamp = float(row["date"])
+
+        scores = self.player_scores.setdefault(player_uuid, {})
+        self.level_players.setdefault(level_uuid, set()).add(player_uuid)
+        key = (level_uuid, value_type)
+        if key not in scores or timestamp > scores[key]["timestamp"]:
+            scores[key] = {
+                "score": int(row["value"]),
+                "level_version": level_version,
+                "timestamp": timestamp,
+                "country": row["country"],
+            }
+
+    def _drop_level(self, level_uuid: str) -> None:
+        for player_uuid in self.level_players.pop(level_uuid, ()):
+            scores = self.player_scores[player_uuid]
+            for key in [key for key in scores if key[0] == level_uuid]:
+                del scores[key]
+
+    def to_tables(self) -> Dict[str, Dict[str, Tuple[str, Sequence]]]:
+        columns = {
+            "player_uuid": [],
+            "level_uuid": [],
+            "value_type": [],
+            "score": [],
+            "level_version": [],
+            "timestamp": [],
+            "country": [],
+        }
+        for player_uuid in sorted(self.player_scores):
+            for (level_uuid, value_type), score_data in self.player_scores[
+                player_uuid
+            ].items():
+                columns["player_uuid"].append(player_uuid)
+                columns["level_uuid"].append(level_uuid)
+                columns["value_type"].append(value_type)
+                for name in ("score", "level_version", "timestamp", "country"):
+                    columns[name].append(score_data[name])
+
+        kinds = {
+            "value_type": "q",
+            "score": "q",
+            "level_version": "q",
+            "timestamp": "d",
+        }
+        level_uuids = sorted(self.level_versions)
+        return {
+            "scores": {
+                name: (kinds.get(name, "str"), values)
+                for name, values in columns.items()
+            },
+            "levels": {
+                "level_uuid": ("str", level_uuids),
+                "level_version": (
+                    "q",
+                    [self.level_versions[level_uuid] for level_uuid in level_uuids],
+                ),
+            },
+        }
+
+
+class ScoreTable:
+    """Read side of `ScoreIndex`, attached from the shared cache."""
+
+    def __init__(self, meta: Dict[str, Any], tables: Dict[str, ColumnTable]):
+        self.meta = meta
+        self.scores = tables["scores"]
+        self.level_versions = TableMap(tables["levels"], "level_uuid", "level_version")
+
+    def player_scores(self, player_uuid: str) -> Iterator[Dict[str, Any]]:
+        return self.scores.rows(self.scores.key_range("player_uuid", player_uuid))
+
+
+def build_incremental_tables(
+    dataset: str, path: Path, index_type: Any
+) -> Tuple[Dict, Dict]:
+    """Folds rows appended to score_data.csv into the previous generation's index.
+
+    The previous tables record the byte offset, row count and checkpoint they
+    were built up to; the CSV is parsed from byte zero only when there are no
+    previous tables or the file was truncated or rewritten.
+    """
+    index, offset, row_count = None, 0, 0
+
+    previous = latest_shared_tables(dataset)
+    if previous is not None:
+        meta, tables = previous
+        checkpoint_offset = meta.get("byte_offset", 0)
+        if checkpoint_offset <= path.stat().st_size and tail_checkpoint(
+            path, checkpoint_offset
+        ) == meta.get("checkpoint"):
+            index = index_type.from_tables(tables)
+            offset, row_count = checkpoint_offset, meta.get("row_count", 0)
+
+    if index is None:
+        index = index_type()
+
+    reader = CsvTailReader(path, offset)
+    for row in reader:
+        index.add_row(row)
+
+    meta = {
+        "byte_offset": reader.offset,
+        "row_count": row_count + reader.rows_read,
+        "checkpoint": tail_checkpoint(path, reader.offset),
+    }
+    return index.to_tables(), meta
+
+
+def build_score_tables(path: Path) -> Tuple[Dict, Dict]:
+    return build_incremental_tables("score_index", path, ScoreIndex)
+
+
+def load_score_table(path: Path) -> ScoreTable:
+    return ScoreTable(*attach_shared_tables("score_index", path, build_score_tables))
+
+
+class ScoreHistory:
+    """Every row of score_data.csv in file order, for the bulk score export."""
+
+    KINDS = {
+        "player_uuid": "str",
+        "level_uuid": "str",
+        "level_version": "q",
+        "value_type": "q",
+        "score": "q",
+        "timestamp": "d",
+        "country": "str",
+    }
+
+    def __init__(self):
+        self.columns: Dict[str, List[Any]] = {name: [] for name in self.KINDS}
+
+    @classmethod
+    def from_tables(cls, tables: Dict[str, ColumnTable]) -> "ScoreHistory":
+        history = cls()
+        history.columns = {name: list(tables["scores"][name]) for name in cls.KINDS}
+        return history
+
+    def add_row(self, row: Dict[str, str]) -> None:
+        self.columns["player_uuid"].append(row["account_ids"])
+        self.columns["level_uuid"].append(row["level_uuid"])
+        self.columns["level_version"].append(int(row["level_version"]))
+        self.columns["value_type"].append(int(row["value_type"]))
+        self.columns["score"].append(int(row["value"]))
+        self.columns["timestamp"].append(float(row["date"]))
+        self.columns["country"].append(row["country"])
+
+    def to_tables(self) -> Dict[str, Dict[str, Tuple[str, Sequence]]]:
+        return {
+            "scores": {
+                name: (kind, self.columns[name]) for name, kind in self.KINDS.items()
+            }
+        }
+
+
+def build_score_history_tables(path: Path) -> Tuple[Dict, Dict]:
+    return build_incremental_tables("score_history", path, ScoreHistory)
+
+
+def build_account_tables(path: Path) -> Tuple[Dict, Dict]:
+    player_name_map = parse_account_names(path)
+    account_ids = sorted(player_name_map)
+    tables = {
+        "accounts": {
+            "account_id": ("str", account_ids),
+            "username": ("str", [player_name_map[uuid] for uuid in account_ids]),
+        }
+    }
+    return tables, {}
+
+
+def load_account_names(path: Path) -> Mapping:
+    _, tables = attach_shared_tables("account_names", path, build_account_tables)
+    return TableMap(tables["accounts"], "account_id", "username")
+
+
+class LevelScoreIndex:
+    """Latest score of each player per (level, version, value_type), on every version."""
+
+    def __init__(self):
+        self.scores: Dict[Tuple[str, int, int, str], Tuple[int, float, str]] = {}
+
+    @classmethod
+    def from_tables(cls, tables: Dict[str, ColumnTable]) -> "LevelScoreIndex":
+        index = cls()
+        scores = tables["scores"]
+        for row in scores.rows():
+            key = (
+                row["level_uuid"],
+                row["level_version"],
+                row["value_type"],
+                row["player_uuid"],
+            )
+            index.scores[key] = (row["score"], row["timestamp"], row["country"])
+        return index
+
+    def add_row(self, row: Dict[str, str]) -> None:
+        key = (
+            row["level_uuid"],
+            int(row["level_version"]),
+            int(row["value_type"]),
+            row["account_ids"],
+        )
+        timestamp = float(row["date"])
+        current = self.scores.get(key)
+        if current is None or timestamp > current[1]:
+            self.scores[key] = (int(row["value"]), timestamp, row["country"])
+
+    def to_tables(self) -> Dict[str, Dict[str, Tuple[str, Sequence]]]:
+        # Ascending by score inside each group, earlier scores after later
+        # ties so that reading a group backwards ranks them first.
+        keys = sorted(
+            self.scores,
+            key=lambda key: (
+                key[:3],
+                self.scores[key][0],
+                -self.scores[key][1],
+            ),
+        )
+        groups: Dict[str, List[Any]] = {
+            "level_uuid": [],
+            "level_version": [],
+            "value_type": [],
+            "start": [],
+            "end": [],
+        }
+        position = 0
+        for group_key, members in itertools.groupby(keys, key=lambda key: key[:3]):
+            count = sum(1 for _ in members)
+            groups["level_uuid"].append(group_key[0])
+            groups["level_version"].append(group_key[1])
+            groups["value_type"].append(group_key[2])
+            groups["start"].append(position)
+            groups["end"].append(position + count)
+            position += count
+
+        return {
+            "scores": {
+                "level_uuid": ("str", [key[0] for key in keys]),
+                "level_version": ("q", [key[1] for key in keys]),
+                "value_type": ("q", [key[2] for key in keys]),
+                "player_uuid": ("str", [key[3] for key in keys]),
+                "score": ("q", [self.scores[key][0] for key in keys]),
+                "timestamp": ("d", [self.scores[key][1] for key in keys]),
+                "country": ("str", [self.scores[key][2] for key in keys]),
+            },
+            "groups": {
+                name: ("str" if name == "level_uuid" else "q", values)
+                for name, values in groups.items()
+            },
+        }
+
+
+class LevelScoreTable:
+    """Read side of `LevelScoreIndex`: one ascending score run per group."""
+
+    def __init__(self, meta: Dict[str, Any], tables: Dict[str, ColumnTable]):
+        self.meta = meta
+        self.scores = tables["scores"]
+        self.groups = tables["groups"]
+
+    def group(
+        self, level_uuid: str, value_type: int, level_version: Optional[int] = None
+    ) -> Optional[Tuple[int, int, int]]:
+        """(version, start, end) of a group; the level's newest version by default."""
+        found = None
+        for index in self.groups.key_range("level_uuid", level_uuid):
+            if self.groups["value_type"][index] != value_type:
+                continue
+            version = self.groups["level_version"][index]
+            if level_version is None or version == level_version:
+                if found is None or version > found[0]:
+                    found = (
+                        version,
+                        self.groups["start"][index],
+                        self.groups["end"][index],
+                    )
+        return found
+
+    def top(self, start: int, end: int, limit: int) -> Iterator[Tuple[int, Dict]]:
+        """Best `limit` rows of a group with their competition rank."""
+        scores = self.scores["score"]
+        for index in range(end - 1, max(start, end - limit) - 1, -1):
+            yield self.rank(start, end, scores[index]), self.scores.row(index)
+
+    def rank(self, start: int, end: int, score: int) -> int:
+        """1 + the number of scores in the group strictly above `score`."""
+        return end - bisect.bisect_right(self.scores["score"], score, start, end) + 1
+
+    def below(self, start: int, end: int, score: int) -> int:
+        """Number of scores in the group strictly below `score`."""
+        return bisect.bisect_left(self.scores["score"], score, start, end) - start
+
+
+def build_level_score_tables(path: Path) -> Tuple[Dict, Dict]:
+    return build_incremental_tables("level_scores", path, LevelScoreIndex)
+
+
+def load_level_score_table(path: Path) -> LevelScoreTable:
+    return LevelScoreTable(
+        *attach_shared_tables("level_scores", path, build_level_score_tables)
+    )
+
+
+def build_player_country_tables(path: Path) -> Tuple[Dict, Dict]:
+    """Country of each player's most recent score."""
+    scores = load_score_table(path).scores
+    latest: Dict[str, Tuple[float, str]] = {}
+    for player_uuid, timestamp, country in zip(
+        scores["player_uuid"], scores["timestamp"], scores["country"]
+    ):
+        if player_uuid not in latest or timestamp > latest[player_uuid][0]:
+            latest[player_uuid] = (timestamp, country)
+    player_uuids = sorted(latest)
+    tables = {
+        "players": {
+            "player_uuid": ("str", player_uuids),
+            "country": ("str", [latest[uuid][1] for uuid in player_uuids]),
+        }
+    }
+    return tables, {}
+
+
+def load_player_countries(path: Path) -> Mapping:
+    _, tables = attach_shared_tables(
+        "player_countries", path, build_player_country_tables
+    )
+    return TableMap(tables["players"], "player_uuid", "country")
+
+
+def normalize_username(name: str) -> str:
+    return unicodedata.normalize("NFKC", name).casefold()
+
+
+class UsernameIndex:
+    """Usernames sorted by their normalized form, for prefix lookups."""
+
+    def __init__(self, meta: Dict[str, Any], tables: Dict[str, ColumnTable]):
+        self.meta = meta
+        self.names = tables["names"]
+
+    def search(self, prefix: str, limit: int) -> List[Tuple[str, str]]:
+        prefix = normalize_username(prefix)
+        normalized = self.names["normalized"]
+        usernames = self.names["username"]
+        account_ids = self.names["account_id"]
+
+        matches = []
+        index = bisect.bisect_left(normalized, prefix)
+        while (
+            index < len(normalized)
+            and len(matches) < limit
+            and normalized[index].startswith(prefix)
+        ):
+            matches.append((account_ids[index], usernames[index]))
+            index += 1
+        return matches
+
+
+def build_username_index_tables(path: Path) -> Tuple[Dict, Dict]:
+    entries = sorted(
+        (normalize_username(username), username, account_id)
+        for account_id, username in parse_account_names(path).items()
+    )
+    tables = {
+        "names": {
+            "normalized": ("str", [entry[0] for entry in entries]),
+            "username": ("str", [entry[1] for entry in entries]),
+            "account_id": ("str", [entry[2] for entry in entries]),
+        }
+    }
+    return tables, {}
+
+
+def load_username_index(path: Path) -> UsernameIndex:
+    return UsernameIndex(
+        *attach_shared_tables("username_index", path, build_username_index_tables)
+    )
+
+
+PLAYER_CHANGE_COLUMNS = {
+    "xp_changes": {"timestamp": "d", "xp": "q"},
+    "blitz_changes": {"timestamp": "d", "bsr": "q"},
+    "usernames": {"timestamp": "d", "name": "str"},
+}
+
+
+class PlayerChanges:
+    """Per-player xp, blitz and username histories from player_changes.json."""
+
+    def __init__(self, meta: Dict[str, Any], tables: Dict[str, ColumnTable]):
+        self.meta = meta
+        self.tables = tables
+
+    def history(self, kind: str, player_uuid: str) -> Iterator[Dict[str, Any]]:
+        table = self.tables.get(kind)
+        if table is None:
+            return iter(())
+        return table.rows(table.key_range("player_uuid", player_uuid))
+
+
+def build_player_change_tables(path: Path) -> Tuple[Dict, Dict]:
+    player_data = parse_json_file(path)
+
+    tables = {}
+    for kind, fields in PLAYER_CHANGE_COLUMNS.items():
+        columns = {"player_uuid": []}
+        columns.update({field: [] for field in fields})
+        for player_uuid in sorted(player_data):
+            player = player_data[player_uuid]
+            if not player:
+                continue
+            for entry in player.get(kind, []):
+                columns["player_uuid"].append(player_uuid)
+                for field, field_kind in fields.items():
+                    value = entry[field]
+                    columns[field].append(int(value) if field_kind == "q" else value)
+        tables[kind] = {
+            name: (fields.get(name, "str"), values) for name, values in columns.items()
+        }
+
+    return tables, {}
+
+
+def load_player_changes(path: Path) -> PlayerChanges:
+    return PlayerChanges(
+        *attach_shared_tables("player_changes", path, build_player_change_tables)
+    )
+
+
+class NameHistoryIndex:
+    """Every name a player has held, sorted by normalized name.
+
+    Each row covers the time range the name was in use; `valid_until` is NaN
+    for a player's current name.
+    """
+
+    def __init__(self, meta: Dict[str, Any], tables: Dict[str, ColumnTable]):
+        self.meta = meta
+        self.names = tables["names"]
+
+    def lookup(self, name: str) -> Iterator[Dict[str, Any]]:
+        matches = self.names.key_range("normalized", normalize_username(name))
+        return self.names.rows(matches)
+
+
+def build_name_history_tables(path: Path) -> Tuple[Dict, Dict]:
+    player_data = parse_json_file(path)
+
+    entries = []
+    for player_uuid, player in player_data.items():
+        if not player:
+            continue
+
+        runs = []
+        for entry in sorted(player.get("usernames", []), key=lambda x: x["timestamp"]):
+            normalized = normalize_username(entry["name"])
+            if not runs or runs[-1][0] != normalized:
+                runs.append((normalized, entry))
+
+        for index, (normalized, entry) in enumerate(runs):
+            valid_until = (
+                runs[index + 1][1]["timestamp"] if index + 1 < len(runs) else math.nan
+            )
+            entries.append(
+                (
+                    normalized,
+                    entry["timestamp"],
+                    player_uuid,
+                    entry["name"],
+                    valid_until,
+                )
+            )
+    entries.sort(key=lambda x: (x[0], x[1]))
+
+    tables = {
+        "names": {
+            "normalized": ("str", [entry[0] for entry in entries]),
+            "valid_from": ("d", [entry[1] for entry in entries]),
+            "player_uuid": ("str", [entry[2] for entry in entries]),
+            "name": ("str", [entry[3] for entry in entries]),
+            "valid_until": ("d", [entry[4] for entry in entries]),
+        }
+    }
+    return tables, {}
+
+
+def load_name_history_index(path: Path) -> NameHistoryIndex:
+    return NameHistoryIndex(
+        *attach_shared_tables("name_history", path, build_name_history_tables)
+    )
+
+
+def group_scores_by_level(
+    score_table: Any, player_uuids: List[str]
+) -> Dict[str, List[Dict[str, Any]]]:
+    level_groups = {}
+    for player_uuid in dict.fromkeys(player_uuids):
+        for score_data in score_table.player_scores(player_uuid):
+            level_groups.setdefault(score_data["level_uuid"], []).append(score_data)
+    return level_groups
+
+
+def group_scores_by_level_task(
+    score_data_path: str, player_uuids: List[str]
+) -> Dict[str, List[Dict[str, Any]]]:
+    score_table = load_dataset_sync(
+        "score_index", Path(score_data_path), load_score_table
+    )
+    return group_scores_by_level(score_table, player_uuids)
@@ -0,0 +1,600 @@
+"""In-process load test for the API router in main.py.
+
+Generates a synthetic STORAGE_PATH, drives the router over ASGI with one of
+several traffic mixes and reports latency percentiles, throughput and peak
+RSS. Each measurement is repeated --runs times and reported as the median
+of the runs, along with the spread between them.
+
+With --baseline the results are compared against a stored measurement and
+the script exits with status 1 when any gate regresses beyond its allowance:
+the larger of --tolerance and a few times the spread the baseline saw
+between its own runs. A baseline only gates runs with the same parameters
+(mode, mix, concurrency, rate, duration, players and seed); any other run
+exits with status 2.
+
+    python loadtest.py --mix all --concurrency 16 --duration 10
+    python loadtest.py --mode rate --rate 200 --runs 5
+    python loadtest.py --write-baseline loadtest_baseline.json
+    python loadtest.py --baseline loadtest_baseline.json
+"""
+
+import argparse
+import asyncio
+import csv
+import importlib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List
+
+COUNTRIES = ["US", "DE", "PL", "FR", "GB", "JP", "BR"]
+NAME_STEMS = ["Alpha", "beta", "Gamma", "delta", "Echo", "foxtrot", "Golf"]
+ARCHIVE_MONTHS = [(2024, 8), (2024, 9)]
+GATED_METRICS = ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")
+# Multiples of the spread between baseline runs that a gate allows.
+NOISE_SPREADS = 3
+
+
+def generate_storage(root: Path, players: int = 2000, seed: int = 1) -> None:
+    """Writes a synthetic data tree with the layout main.py reads."""
+    rng = random.Random(seed)
+    for directory in [
+        "github_data",
+        "monthly_lb_daily/archive",
+        "monthly_lb_monthly",
+        "speedrun_lb_daily",
+        "xp_lb_archive",
+        "blitz_lb_archive",
+        "quests_archive",
+        "player_data",
+    ]:
+        (root / directory).mkdir(parents=True, exist_ok=True)
+
+    uuids = [f"p{i:05d}" for i in range(players)]
+    names = {uuid: f"{rng.choice(NAME_STEMS)}{i}" for i, uuid in enumerate(uuids)}
+    countries = {uuid: rng.choice(COUNTRIES) for uuid in uuids}
+    levels = [f"lvl{i:03d}" for i in range(100)]
+
+    with open(root / "github_data/account_data.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["account_id", "username"])
+        writer.writerows([uuid, names[uuid]] for uuid in uuids)
+
+    with open(root / "github_data/level_data.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["level_uuid", "name"])
+        writer.writerows([level, f"Level {level}"] for level in levels)
+
+    with open(root / "github_data/score_data.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            [
+                "account_ids",
+                "level_uuid",
+                "level_version",
+                "value",
+                "value_type",
+                "date",
+                "country",
+            ]
+        )
+        for i in range(players * 25):
+            uuid = rng.choice(uuids)
+            writer.writerow(
+                [
+                    uuid,
+                    rng.choice(levels),
+                    rng.choice([1, 2]),
+                    rng.randint(0, 100000),
+                    rng.choice([0, 1]),
+                    1700000000 + i,
+                    countries[uuid],
+                ]
+            )
+
+    with open(root / "github_data/metadata.json", "w") as f:
+        json.dump({"timestamp": 1727000000.0}, f)
+
+    with open(root / "monthly_lb_daily/leaderboard.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["player_uuid", "country", "score", "wrs", "average_place"])
+        for i, uuid in enumerate(uuids[:500]):
+            writer.writerow([uuid, countries[uuid], 50000 - i, i % 7, 1.5 + i / 10])
+
+    with open(root / "speedrun_lb_daily/leaderboard.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            [
+                "player_uuid",
+                "country",
+                "score_1p_official",
+                "score_2p_official",
+                "score_1p_community",
+                "score_2p_community",
+            ]
+        )
+        for i, uuid in enumerate(uuids[:300]):
+            writer.writerow([uuid, countries[uuid], float(i), 2.0, 3.0, 4.0])
+
+    (root / "monthly_lb_monthly/levels.txt").write_text("\n".join(levels[:5]) + "\n")
+    levels_archive = [
+        {
+            "timestamp": datetime(2024, month, 1, 12, tzinfo=timezone.utc).timestamp(),
+            "levels": levels[month * 5 : month * 5 + 5],
+        }
+        for month in range(1, 13)
+    ]
+    with open(root / "monthly_lb_monthly/levels_archive.json", "w") as f:
+        json.dump(levels_archive, f)
+
+    for year, month in ARCHIVE_MONTHS:
+        xp, blitz, quests, monthly = [], [], [], []
+        for day in range(1, 29):
+            for hour in range(24):
+                ts = datetime(year, month, day, hour, tzinfo=timezone.utc).timestamp()
+                xp.append(
+                    {
+                        "timestamp": ts,
+                        "data": [
+                            {
+                                "acc": uuid,
+                                "name": names[uuid],
+                                "xp": 10000 + day * 100 + hour * 3 + i,
+                            }
+                            for i, uuid in enumerate(uuids[:200])
+                        ],
+                    }
+                )
+                blitz.append(
+                    {
+                        "timestamp": ts,
+                        "data": [
+                            {"acc": uuid, "name": names[uuid], "bsr": 500 + day + i}
+                            for i, uuid in enumerate(uuids[:100])
+                        ],
+                    }
+                )
+            ts = datetime(year, month, day, 0, 5, tzinfo=timezone.utc).timestamp()
+            quests.append(
+                {
+                    "timestamp": ts,
+                    "data": {
+                        "version": 1,
+                        "expiration": int(ts) + 86400,
+                        "quests_id": day,
+                        "quests": [
+                            {
+                                "kind": 1,
+                                "goal": 3,
+                                "levels": [
+                                    {"uuid": levels[day], "version": 1, "name": "L"}
+                                ],
+                                "xp": 100,
+                            }
+                        ],
+                    },
+                }
+            )
+            monthly.append(
+                {
+                    "timestamp": ts,
+                    "data": [
+                        {
+                            "player_uuid": uuid,
+                            "country": countries[uuid],
+                            "score": 1000 - i,
+                            "wrs": i % 3,
+                            "average_place": 2.0 + i,
+                        }
+                        for i, uuid in enumerate(uuids[:100])
+                    ],
+                }
+            )
+        suffix = f"{month:02d}_{year}.json"
+        for path, entries in [
+            (f"xp_lb_archive/xp_lb_{suffix}", xp),
+            (f"blitz_lb_archive/blitz_lb_{suffix}", blitz),
+            (f"quests_archive/quests_{suffix}", quests),
+            (f"monthly_lb_daily/archive/monthly_lb_{suffix}", monthly),
+        ]:
+            with open(root / path, "w") as f:
+                json.dump(entries, f)
+
+    player_changes = {
+        uuid: {
+            "xp_changes": [
+                {"timestamp": 1700000000 + k * 3600, "xp": 100 * k} for k in range(20)
+            ],
+            "blitz_changes": [
+                {"timestamp": 1700000000 + k * 3600, "bsr": 10 * k} for k in range(10)
+            ],
+            "usernames": [
+                {"timestamp": 1690000000, "name": "old_" + names[uuid]},
+                {"timestamp": 1700000000, "name": names[uuid]},
+            ],
+        }
+        for uuid in uuids
+    }
+    with open(root / "player_data/player_changes.json", "w") as f:
+        json.dump(player_changes, f)
+
+
+def archive_timestamp(rng: random.Random) -> int:
+    year, month = rng.choice(ARCHIVE_MONTHS)
+    day, hour = rng.randint(1, 28), rng.randint(0, 23)
+    return int(datetime(year, month, day, hour, tzinfo=timezone.utc).timestamp())
+
+
+def leaderboard_poll(rng: random.Random, players: int) -> List[str]:
+    return [
+        rng.choice(
+            [
+                "/get_monthly_leaderboard",
+                "/get_speedrun_leaderboard",
+                "/health",
+            ]
+        )
+    ]
+
+
+def player_page(rng: random.Random, players: int) -> List[str]:
+    uuid = f"p{rng.randrange(players):05d}"
+    return [
+        f"/player/{uuid}/get_username",
+        f"/player/{uuid}/get_xp_history",
+        f"/player/{uuid}/get_blitz_history",
+        f"/player/{uuid}/get_username_change_history",
+        f"/player/{uuid}/get_leaderboard_placements",
+    ]
+
+
+def archive_browse(rng: random.Random, players: int) -> List[str]:
+    year, month = rng.choice(ARCHIVE_MONTHS)
+    return [
+        rng.choice(
+            [
+                f"/archive/xp_leaderboard/{archive_timestamp(rng)}",
+                f"/archive/blitz_leaderboard/{archive_timestamp(rng)}",
+                f"/archive/uptime/xp_leaderboard/{year}/{month}",
+                f"/archive/uptime/quests/{year}/{month}",
+                f"/archive/quests/{year}/{month}/{rng.randint(1, 28)}",
+                f"/get_monthly_leaderboard/{year}/{month}",
+            ]
+        )
+    ]
+
+
+def warmup_urls(players: int) -> List[str]:
+    """One request per dataset the scenarios touch."""
+    urls = [
+        "/get_monthly_leaderboard",
+        "/get_speedrun_leaderboard",
+    ] + player_page(random.Random(0), players)
+    for year, month in ARCHIVE_MONTHS:
+        ts = int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp())
+        urls += [
+            f"/archive/xp_leaderboard/{ts}",
+            f"/archive/blitz_leaderboard/{ts}",
+            f"/archive/uptime/xp_leaderboard/{year}/{month}",
+            f"/archive/uptime/quests/{year}/{month}",
+            f"/archive/quests/{year}/{month}/1",
+            f"/get_monthly_leaderboard/{year}/{month}",
+        ]
+    return urls
+
+
+SCENARIOS: Dict[str, Callable[[random.Random, int], List[str]]] = {
+    "leaderboard": leaderboard_poll,
+    "player": player_page,
+    "archive": archive_browse,
+}
+MIXES = {
+    "leaderboard": {"leaderboard": 1},
+    "player": {"player": 1},
+    "archive": {"archive": 1},
+    "all": {"leaderboard": 5, "player": 3, "archive": 2},
+}
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Recorder:
+    """Collects per-scenario request latencies and status codes."""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, scenario: str, latency: float, status: int) -> None:
+        self.latencies.setdefault(scenario, []).append(latency)
+        if status >= 400:
+            self.errors[scenario] = self.errors.get(scenario, 0) + 1
+
+    def summary(self, elapsed: float) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for scenario, samples in sorted(self.latencies.items()):
+            result[scenario] = {
+                "requests": len(samples),
+                "errors": self.errors.get(scenario, 0),
+                "p50_ms": percentile(samples, 0.50) * 1000,
+                "p95_ms": percentile(samples, 0.95) * 1000,
+                "p99_ms": percentile(samples, 0.99) * 1000,
+                "throughput_rps": len(samples) / elapsed,
+            }
+        return result
+
+
+async def run_action(client, recorder: Recorder, scenario: str, urls: List[str]):
+    async def fetch(url: str) -> None:
+        started = time.perf_counter()
+        response = await client.get(url)
+        recorder.record(scenario, time.perf_counter() - started, response.status_code)
+
+    # A page view fans out its requests concurrently, like a browser would.
+    await asyncio.gather(*(fetch(url) for url in urls))
+
+
+async def drive(app, args) -> Dict:
+    import httpx
+
+    rng = random.Random(args.seed)
+    weights = MIXES[args.mix]
+    names, counts = list(weights), list(weights.values())
+    recorder = Recorder()
+
+    def next_action():
+        scenario = rng.choices(names, counts)[0]
+        return scenario, SCENARIOS[scenario](rng, args.players)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://loadtest"
+    ) as client:
+        # Warm the caches once so the run measures steady state, not cold parses.
+        for url in warmup_urls(args.players):
+            await client.get(url)
+
+        deadline = time.perf_counter() + args.duration
+        started = time.perf_counter()
+        if args.mode == "concurrency":
+
+            async def user() -> None:
+                while time.perf_counter() < deadline:
+                    await run_action(client, recorder, *next_action())
+
+            await asyncio.gather(*(user() for _ in range(args.concurrency)))
+        else:
+            # Open-loop arrivals: requests start on schedule whether or not
+            # earlier ones have finished, so queueing shows up in latency.
+            pending = set()
+            interval = 1.0 / args.rate
+            next_start = started
+            while next_start < deadline:
+                delay = next_start - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                task = asyncio.create_task(run_action(client, recorder, *next_action()))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                next_start += rng.expovariate(1.0 / interval)
+            await asyncio.gather(*pending)
+        elapsed = time.perf_counter() - started
+
+    return {"duration_s": elapsed, "scenarios": recorder.summary(elapsed)}
+
+
+async def measure(app, args) -> List[Dict]:
+    # One event loop for every run: the router's gates and caches bind to it.
+    return [await drive(app, args) for _ in range(args.runs)]
+
+
+def run_parameters(args) -> Dict:
+    """The parameters a baseline has to share with a run to gate it."""
+    return {
+        "mode": args.mode,
+        "mix": args.mix,
+        "concurrency": args.concurrency if args.mode == "concurrency" else None,
+        "rate": args.rate if args.mode == "rate" else None,
+        "duration": args.duration,
+        "players": args.players,
+        "seed": args.seed,
+    }
+
+
+def combine(parameters: Dict, runs: List[Dict]) -> Dict:
+    """Reduces repeated runs to the median and spread of every metric."""
+    scenarios = {}
+    for scenario in sorted({name for run in runs for name in run["scenarios"]}):
+        samples = [
+            run["scenarios"][scenario] for run in runs if scenario in run["scenarios"]
+        ]
+        stats = {
+            "requests": sum(sample["requests"] for sample in samples),
+            "errors": sum(sample["errors"] for sample in samples),
+        }
+        for metric in GATED_METRICS:
+            values = [sample[metric] for sample in samples]
+            stats[metric] = statistics.median(values)
+            stats[f"{metric}_spread"] = max(values) - min(values)
+        scenarios[scenario] = stats
+    return {
+        "parameters": parameters,
+        "runs": len(runs),
+        "duration_s": sum(run["duration_s"] for run in runs),
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "scenarios": scenarios,
+    }
+
+
+def parameter_mismatches(result: Dict, baseline: Dict) -> List[str]:
+    """Returns every run parameter the baseline was recorded with differently."""
+    expected = baseline.get("parameters")
+    if expected is None:
+        return ["the baseline does not record its run parameters"]
+    return [
+        f"{name}: {value!r}, baseline {expected.get(name)!r}"
+        for name, value in result["parameters"].items()
+        if expected.get(name) != value
+    ]
+
+
+def compare(result: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Returns a description of every gate the result fails."""
+    failures = []
+    for scenario, expected in baseline["scenarios"].items():
+        actual = result["scenarios"].get(scenario)
+        if actual is None:
+            failures.append(f"{scenario}: no requests recorded")
+            continue
+        for metric in GATED_METRICS:
+            allowance = max(
+                expected[metric] * tolerance,
+                expected[f"{metric}_spread"] * NOISE_SPREADS,
+            )
+            if metric == "throughput_rps":
+                limit = expected[metric] - allowance
+                if actual[metric] < limit:
+                    failures.append(
+                        f"{scenario}: {metric} {actual[metric]:.1f} < {limit:.1f}"
+                    )
+            else:
+                limit = expected[metric] + allowance
+                if actual[metric] > limit:
+                    failures.append(
+                        f"{scenario}: {metric} {actual[metric]:.2f} > {limit:.2f}"
+                    )
+        # Runs may repeat a different number of times, so compare error rates.
+        if (
+            actual["errors"] * expected["requests"]
+            > expected["errors"] * actual["requests"]
+        ):
+            failures.append(
+                f"{scenario}: errors {actual['errors']}/{actual['requests']}"
+                f" > {expected['errors']}/{expected['requests']}"
+            )
+    limit = baseline["rss_mb"] * (1 + tolerance)
+    if result["rss_mb"] > limit:
+        failures.append(f"rss_mb {result['rss_mb']:.1f} > {limit:.1f}")
+    return failures
+
+
+def print_report(result: Dict) -> None:
+    parameters = result["parameters"]
+    print(
+        f"mode={parameters['mode']} mix={parameters['mix']} runs={result['runs']} "
+        f"duration={result['duration_s']:.1f}s rss={result['rss_mb']:.1f}MB"
+    )
+    print("medians over the runs, with the spread between runs in brackets")
+    print(
+        f"{'scenario':<12}{'requests':>10}{'errors':>8}{'p50 ms':>16}"
+        f"{'p95 ms':>16}{'p99 ms':>16}{'req/s':>16}"
+    )
+    for scenario, stats in result["scenarios"].items():
+        print(
+            f"{scenario:<12}{stats['requests']:>10}{stats['errors']:>8}"
+            + "".join(
+                f"{stats[metric]:>9.2f} ({stats[f'{metric}_spread']:4.2f})"
+                for metric in GATED_METRICS
+            )
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mix", choices=sorted(MIXES), default="all")
+    parser.add_argument(
+        "--mode", choices=["concurrency", "rate"], default="concurrency"
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=100.0, help="actions per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--players", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--runs", type=int, default=3, help="repeat the measurement, report medians"
+    )
+    parser.add_argument(
+        "--storage", type=Path, help="existing data tree; generated when omitted"
+    )
+    parser.add_argument("--baseline", type=Path, help="fail on regression against it")
+    parser.add_argument("--write-baseline", type=Path)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="allowed relative regression before a gate fails",
+    )
+    parser.add_argument("--json", action="store_true", help="print raw results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as workdir:
+        storage = args.storage
+        if storage is None:
+            storage = Path(workdir) / "storage"
+            # Generated in a child process so the peak RSS reported for this
+            # process is the server's, not the generator's.
+            generator = multiprocessing.get_context("spawn").Process(
+                target=generate_storage, args=(storage, args.players, args.seed)
+            )
+            generator.start()
+            generator.join()
+            if generator.exitcode != 0:
+                print("generating the storage tree failed", file=sys.stderr)
+                return 1
+        # settings.py reads the configuration when main.py is imported.
+        os.environ["STORAGE_PATH"] = str(storage)
+        os.environ.setdefault("SHARED_CACHE_PATH", str(Path(workdir) / "cache"))
+        # The API modules import each other relative to their package, so
+        # main.py is imported as learning.fastapi.main from the repo root.
+        sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+        api = importlib.import_module("learning.fastapi.main")
+
+        from fastapi import FastAPI
+
+        app = FastAPI()
+        app.include_router(api.router)
+        result = combine(run_parameters(args), asyncio.run(measure(app, args)))
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+    if args.write_baseline:
+        with open(args.write_baseline, "w") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        mismatches = parameter_mismatches(result, baseline)
+        for mismatch in mismatches:
+            print(f"MISMATCH {mismatch}")
+        if mismatches:
+            print("the baseline was recorded with other parameters, not comparing")
+            return 2
+        failures = compare(result, baseline, args.tolerance)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            return 1
+        print("no regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
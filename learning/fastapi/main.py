@@ -1,189 +1,357 @@
-import csv
+import asyncio
+import calendar
 import json
+import math
 import os
-from datetime import datetime, timedelta, timezone
+import re
+import tempfile
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional
-
-from dotenv import load_dotenv
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
-
-load_dotenv()
-
-STORAGE_PATH = os.getenv("STORAGE_PATH", "/storage")
-
-router = APIRouter()
-
-
-class LeaderboardEntry(BaseModel):
-    player_uuid: str
-    player_name: str
-    country: str
-    score: int
-    wrs: int
-    average_place: float
-
-
-class LevelInfo(BaseModel):
-    uuid: str
-    name: str
-
-
-class MonthlyLeaderboardResponse(BaseModel):
-    timestamp: float
-    levels: List[LevelInfo]
-    leaderboard: List[LeaderboardEntry]
-
-
-class MonthlyLevelsResponse(BaseModel):
-    year: int
-    month: int
-    timestamp: float
-    levels: List[str]
-
-
-class SpeedrunLeaderboardEntry(BaseModel):
-    player_uuid: str
-    player_name: str
-    country: str
-    score_1p_official: float
-    score_2p_official: float
-    score_1p_community: float
-    score_2p_community: float
-
-
-class SpeedrunLeaderboardResponse(BaseModel):
-    timestamp: float
-    leaderboard: List[SpeedrunLeaderboardEntry]
-
-
-class XPLeaderboardEntry(BaseModel):
-    acc: str
-    name: str
-    xp: int
-
-
-class XPLeaderboardResponse(BaseModel):
-    timestamp: float
-    data: List[XPLeaderboardEntry]
-
-
-class DayStatus(BaseModel):
-    day: int
-    status: str
-
-
-class MonthUptimeResponse(BaseModel):
-    year: int
-    month: int
-    days: List[DayStatus]
-
-
-class BlitzLeaderboardEntry(BaseModel):
-    acc: str
-    name: str
-    bsr: int
-
-
-class BlitzLeaderboardResponse(BaseModel):
-    timestamp: float
-    data: List[BlitzLeaderboardEntry]
-
-
-class QuestLevel(BaseModel):
-    uuid: str
-    version: int
-    name: str
-
-
-class Quest(BaseModel):
-    kind: int
-    goal: int
-    levels: List[QuestLevel] = []
-    xp: int
-    enemy: Optional[str] = None
-
-
-class QuestData(BaseModel):
-    version: int
-    expiration: int
-    quests_id: int
-    quests: List[Quest]
-
-
-class QuestResponse(BaseModel):
-    timestamp: float
-    data: QuestData
-
-
-class PlayerXPHistoryPoint(BaseModel):
-    timestamp: float
-    xp: int
-
-
-class PlayerXPHistoryResponse(BaseModel):
-    player_uuid: str
-    history: List[PlayerXPHistoryPoint]
-
-
-class PlayerBlitzHistoryPoint(BaseModel):
-    timestamp: float
-    bsr: int
-
-
-class PlayerBlitzHistoryResponse(BaseModel):
-    player_uuid: str
-    history: List[PlayerBlitzHistoryPoint]
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
 
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, StreamingResponse
+
+from .admission import admission, admission_gates
+from .archives import (
+    FULL_DAY_MASK,
+    LEADERBOARD_ARCHIVES,
+    UPTIME_ARCHIVES,
+    ArchiveIndex,
+    archive_snapshot_rows,
+    build_leaderboard_archive_tables,
+    load_archive_country_groups,
+    load_archive_coverage,
+    load_archive_index,
+    load_board_archive,
+    load_leaderboard_archive,
+    load_levels_archive_index,
+    snapshot_gains_task,
+)
+from .datasets import file_generation, load_dataset, run_cpu_heavy
+from .generation import (
+    current_generation,
+    get_level_name_map,
+    get_player_changes,
+    get_player_name_map,
+)
+from .indexes import (
+    PlayerChanges,
+    build_account_tables,
+    build_score_history_tables,
+    build_score_tables,
+    group_scores_by_level,
+    group_scores_by_level_task,
+    load_level_score_table,
+    load_name_history_index,
+    load_username_index,
+)
+from .models import (
+    BlitzLeaderboardResponse,
+    ComparisonResponse,
+    CountryBoardStats,
+    CountryStats,
+    CountryStatsResponse,
+    DayCoverage,
+    DayStatus,
+    GetUsernameResponse,
+    LeaderboardEntry,
+    LeaderboardGainer,
+    LeaderboardGainersResponse,
+    LeaderboardPlacement,
+    LevelInfo,
+    LevelRankResponse,
+    LevelScoresGroup,
+    LevelTopResponse,
+    LevelTopScore,
+    MonthUptimeResponse,
+    MonthlyLeaderboardResponse,
+    MonthlyLevelsResponse,
+    NameHistoryLookupResponse,
+    NameHistoryMatch,
+    PlayerBlitzHistoryPoint,
+    PlayerBlitzHistoryResponse,
+    PlayerLeaderboardPlacementsResponse,
+    PlayerLevelScore,
+    PlayerProfileResponse,
+    PlayerSearchResponse,
+    PlayerSearchResult,
+    PlayerXPHistoryPoint,
+    PlayerXPHistoryResponse,
+    ProfileSummary,
+    QuestRangeResponse,
+    QuestResponse,
+    ScoreStanding,
+    SpeedrunLeaderboardEntry,
+    SpeedrunLeaderboardResponse,
+    UsernameChange,
+    UsernameChangeHistoryResponse,
+    XPLeaderboardResponse,
+    YearUptimeResponse,
+)
+from .prefetch import archive_prefetcher
+from .profiling import (
+    PROFILE_ID_PATTERN,
+    ProfilingRoute,
+    profile_dir,
+    require_profile_token,
+)
+from .settings import MAX_QUEST_RANGE_DAYS, STORAGE_BACKEND, STORAGE_PATH
+from .shared_cache import attach_shared_tables, shared_dataset_name, shared_table_path
+from .sources import (
+    BLITZ_LEADERBOARD_COLUMNS,
+    MONTHLY_LEADERBOARD_COLUMNS,
+    XP_LEADERBOARD_COLUMNS,
+    latest_archive_path,
+    resolve_archive_path,
+)
+from .sqlite_store import load_sqlite_scores
+from .tables import TABLE_MEDIA_TYPE, write_tables
+
+NDJSON_CHUNK_ROWS = 500
+EXPORT_CHUNK_BYTES = 1 << 20
+MAX_RANK_BATCH = 1000
+GAINERS_CACHE_SIZE = 32
+
+
+router = APIRouter(route_class=ProfilingRoute)
+
+
+def with_player_names(
+    rows: Iterable[Dict[str, Any]], player_name_map: Mapping
+) -> Iterator[Dict[str, Any]]:
+    for row in rows:
+        player_uuid = row["player_uuid"]
+        yield {
+            "player_uuid": player_uuid,
+            "player_name": player_name_map.get(player_uuid, player_uuid),
+            **row,
+        }
+
+
+def wants_ndjson(request: Request, stream: bool) -> bool:
+    return stream or "application/x-ndjson" in request.headers.get("accept", "")
+
+
+def ndjson_response(
+    header: Dict[str, Any], rows: Iterable[Dict[str, Any]]
+) -> StreamingResponse:
+    """Streams `header` as the first line, then one line per row."""
+
+    def lines() -> Iterator[str]:
+        yield json.dumps(jsonable_encoder(header)) + "\n"
+        chunk = []
+        for row in rows:
+            chunk.append(json.dumps(row))
+            if len(chunk) == NDJSON_CHUNK_ROWS:
+                yield "\n".join(chunk) + "\n"
+                chunk = []
+        if chunk:
+            yield "\n".join(chunk) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def write_table_file(
+    builder: Callable[[Path], Tuple[Dict, Dict]], path: Path
+) -> BinaryIO:
+    """The tables built from `path`, written to an anonymous temporary file."""
+    table_file = tempfile.TemporaryFile()
+    try:
+        write_tables(table_file, *builder(path))
+        table_file.seek(0)
+    except BaseException:
+        table_file.close()
+        raise
+    return table_file
+
+
+async def export_shared_tables(
+    dataset: str,
+    path: Path,
+    builder: Callable[[Path], Tuple[Dict, Dict]],
+    filename: str,
+) -> StreamingResponse:
+    """Serves the shared cache file of `dataset` as a columnar export.
+
+    It is the same file the loaders map, built once per generation of `path`,
+    so the response is sent straight from disk without re-encoding anything.
+    The file is opened before the response starts and streamed from that
+    handle, so a newer generation deleting it cannot cut the download short.
+    """
+
+    def attach(path: Path) -> Path:
+        attach_shared_tables(dataset, path, builder)
+        return shared_table_path(dataset, path)
+
+    table_path = await load_dataset(f"export:{dataset}", path, attach)
+
+    try:
+        table_file = open(table_path, "rb")
+    except FileNotFoundError:
+        # The cache directory is not usable, or a newer generation replaced
+        # the file after it was looked up: the tables are written out for
+        # this response alone.
+        table_file = await asyncio.to_thread(write_table_file, builder, path)
+
+    def chunks() -> Iterator[bytes]:
+        with table_file:
+            while chunk := table_file.read(EXPORT_CHUNK_BYTES):
+                yield chunk
+
+    return StreamingResponse(
+        chunks(),
+        media_type=TABLE_MEDIA_TYPE,
+        headers={
+            "Content-Length": str(os.fstat(table_file.fileno()).st_size),
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            # The cache file name changes with every generation.
+            "ETag": f'"{table_path.stem}"',
+        },
+    )
 
-class LeaderboardPlacement(BaseModel):
-    timestamp: float
-    placement: Optional[int]
-    not_found: bool
 
+WINDOW_UNITS = {"m": 60, "h": 3600, "d": 86400}
 
-class PlayerLeaderboardPlacementsResponse(BaseModel):
-    player_uuid: str
-    monthly_leaderboard: LeaderboardPlacement
-    xp_leaderboard: LeaderboardPlacement
-    blitz_leaderboard: LeaderboardPlacement
 
+def month_day_statuses(
+    coverage: Dict[date, int], year: int, month: int, hourly: bool
+) -> List[DayStatus]:
+    """Uptime status of each day of a month.
 
-class UsernameChange(BaseModel):
-    timestamp: float
-    new_name: str
+    With `hourly` a day is "full data" only when all 24 UTC hours have an
+    entry, otherwise any entry counts.
+    """
+    days = []
+    for day in range(1, calendar.monthrange(year, month)[1] + 1):
+        mask = coverage.get(date(year, month, day), 0)
+        if not mask:
+            status = "no data"
+        elif not hourly or mask == FULL_DAY_MASK:
+            status = "full data"
+        else:
+            status = "partially available"
+        days.append(DayStatus(day=day, status=status))
+    return days
 
 
-class UsernameChangeHistoryResponse(BaseModel):
-    player_uuid: str
-    changes: List[UsernameChange]
+def parse_window(window: str) -> int:
+    """Length in seconds of a window such as "90m", "24h" or "7d"."""
+    match = re.fullmatch(r"([1-9][0-9]{0,4})([mhd])", window)
+    if match is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid window {window}, expected minutes, hours or days like 24h",
+        )
+    return int(match.group(1)) * WINDOW_UNITS[match.group(2)]
 
 
-class GetUsernameResponse(BaseModel):
-    player_uuid: str
-    username: str
+_gainers_cache: "OrderedDict[Tuple, asyncio.Future[List[Tuple[int, int, int]]]]" = (
+    OrderedDict()
+)
 
 
-class PlayerLevelScore(BaseModel):
-    player_uuid: str
-    score: int
-    level_version: int
-    value_type: int
-    timestamp: float
-    country: str
+async def cached_snapshot_gains(
+    board: str,
+    value_column: str,
+    start: Tuple[Path, float],
+    end: Tuple[Path, float],
+) -> List[Tuple[int, int, int]]:
+    """Ranking of one snapshot pair, computed once in the CPU pool.
+
+    Kept in a small LRU of its own, keyed by the resolved snapshots and the
+    generations of their archives, so however many windows and timestamps
+    clients ask for, they cannot push the datasets out of the dataset cache.
+    """
+    (start_path, start_timestamp), (end_path, end_timestamp) = start, end
+    key = (
+        str(start_path),
+        file_generation(start_path),
+        start_timestamp,
+        str(end_path),
+        file_generation(end_path),
+        end_timestamp,
+    )
 
+    ranking = _gainers_cache.get(key)
+    if ranking is None:
+        ranking = _gainers_cache[key] = asyncio.ensure_future(
+            run_cpu_heavy(
+                snapshot_gains_task,
+                board,
+                value_column,
+                str(start_path),
+                start_timestamp,
+                str(end_path),
+                end_timestamp,
+            )
+        )
 
-class LevelScoresGroup(BaseModel):
-    level_uuid: str
-    level_name: str
-    scores: List[PlayerLevelScore]
+        def forget_failure(done: "asyncio.Future[Any]") -> None:
+            if done.cancelled() or done.exception() is not None:
+                if _gainers_cache.get(key) is done:
+                    del _gainers_cache[key]
 
+        ranking.add_done_callback(forget_failure)
+        while len(_gainers_cache) > GAINERS_CACHE_SIZE:
+            _gainers_cache.popitem(last=False)
+    else:
+        _gainers_cache.move_to_end(key)
+
+    return await asyncio.shield(ranking)
+
+
+async def leaderboard_gainers(
+    board: str,
+    value_column: str,
+    window: str,
+    timestamp: Optional[float],
+    limit: int,
+) -> LeaderboardGainersResponse:
+    """Top gainers between the snapshots closest to both ends of a window."""
+    window_seconds = parse_window(window)
+    end = time.time() if timestamp is None else timestamp
+
+    end_path, end_archive = await load_board_archive(board, end)
+    start_path, start_archive = await load_board_archive(board, end - window_seconds)
+    end_timestamp, end_snapshot = end_archive.closest(end)
+    start_timestamp, _ = start_archive.closest(end - window_seconds)
+
+    gains = await cached_snapshot_gains(
+        board,
+        value_column,
+        (start_path, start_timestamp),
+        (end_path, end_timestamp),
+    )
 
-class ComparisonResponse(BaseModel):
-    players: List[str]
-    levels: List[LevelScoresGroup]
+    return LeaderboardGainersResponse(
+        start_timestamp=start_timestamp,
+        end_timestamp=end_timestamp,
+        gainers=[
+            LeaderboardGainer(
+                acc=end_snapshot["acc"][row],
+                name=end_snapshot["name"][row],
+                before=before,
+                after=before + gain,
+                gain=gain,
+            )
+            for gain, row, before in gains[:limit]
+        ],
+    )
 
 
 @router.get(
@@ -213,65 +381,36 @@ async def health():
     tags=["monthly leaderboard"],
     response_model=MonthlyLeaderboardResponse,
 )
-async def get_monthly_leaderboard():
-    base_path = Path(STORAGE_PATH)
+async def get_monthly_leaderboard(
+    request: Request,
+    stream: bool = Query(False, description="Stream rows as NDJSON"),
+    country: Optional[str] = Query(None, description="Only rows of this country code"),
+):
+    generation = await current_generation()
 
-    leaderboard_path = base_path / "monthly_lb_daily/leaderboard.csv"
-    levels_path = base_path / "monthly_lb_monthly/levels.txt"
-    metadata_path = base_path / "github_data/metadata.json"
-    level_data_path = base_path / "github_data/level_data.csv"
-    account_data_path = base_path / "github_data/account_data.csv"
+    rows = iter(())
+    table = generation.monthly_leaderboard
 
-    leaderboard = []
-    levels = []
-    timestamp = 0.0
-
-    player_name_map = {}
-    if account_data_path.exists():
-        with open(account_data_path, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                player_name_map[row["account_id"]] = row["username"]
-
-    if leaderboard_path.exists():
-        with open(leaderboard_path, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                player_uuid = row["player_uuid"]
-                leaderboard.append(
-                    LeaderboardEntry(
-                        player_uuid=player_uuid,
-                        player_name=player_name_map.get(player_uuid, player_uuid),
-                        country=row["country"],
-                        score=int(row["score"]),
-                        wrs=int(row["wrs"]),
-                        average_place=float(row["average_place"]),
-                    )
-                )
+    if table is not None:
+        indices = None
+        if country is not None:
+            indices = generation.monthly_countries.rows(country.upper())
+        rows = with_player_names(table.rows(indices), generation.player_names)
 
-    if levels_path.exists():
-        with open(levels_path, "r", encoding="utf-8") as f:
-            level_uuids = [line.strip() for line in f if line.strip()]
+    levels = [
+        LevelInfo(uuid=uuid, name=generation.level_names.get(uuid, uuid))
+        for uuid in generation.monthly_levels
+    ]
 
-        level_name_map = {}
-        if level_data_path.exists():
-            with open(level_data_path, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    level_name_map[row["level_uuid"]] = row["name"]
+    timestamp = generation.metadata_timestamp
 
-        levels = [
-            LevelInfo(uuid=uuid, name=level_name_map.get(uuid, uuid))
-            for uuid in level_uuids
-        ]
-
-    if metadata_path.exists():
-        with open(metadata_path, "r", encoding="utf-8") as f:
-            metadata = json.load(f)
-            timestamp = metadata.get("timestamp", 0.0)
+    if wants_ndjson(request, stream):
+        return ndjson_response({"timestamp": timestamp, "levels": levels}, rows)
 
     return MonthlyLeaderboardResponse(
-        timestamp=timestamp, levels=levels, leaderboard=leaderboard
+        timestamp=timestamp,
+        levels=levels,
+        leaderboard=[LeaderboardEntry(**row) for row in rows],
     )
 
 
@@ -282,46 +421,82 @@ async def get_monthly_leaderboard():
     tags=["leaderboards"],
     response_model=SpeedrunLeaderboardResponse,
 )
-async def get_speedrun_leaderboard():
-    base_path = Path(STORAGE_PATH)
+async def get_speedrun_leaderboard(
+    request: Request,
+    stream: bool = Query(False, description="Stream rows as NDJSON"),
+    country: Optional[str] = Query(None, description="Only rows of this country code"),
+):
+    generation = await current_generation()
 
-    leaderboard_path = base_path / "speedrun_lb_daily/leaderboard.csv"
-    metadata_path = base_path / "github_data/metadata.json"
-    account_data_path = base_path / "github_data/account_data.csv"
-
-    leaderboard = []
-    timestamp = 0.0
-
-    player_name_map = {}
-    if account_data_path.exists():
-        with open(account_data_path, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                player_name_map[row["account_id"]] = row["username"]
-
-    if leaderboard_path.exists():
-        with open(leaderboard_path, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                player_uuid = row["player_uuid"]
-                leaderboard.append(
-                    SpeedrunLeaderboardEntry(
-                        player_uuid=player_uuid,
-                        player_name=player_name_map.get(player_uuid, player_uuid),
-                        country=row.get("country", ""),
-                        score_1p_official=float(row.get("score_1p_official", 0.0)),
-                        score_2p_official=float(row.get("score_2p_official", 0.0)),
-                        score_1p_community=float(row.get("score_1p_community", 0.0)),
-                        score_2p_community=float(row.get("score_2p_community", 0.0)),
-                    )
-                )
+    rows = iter(())
+    table = generation.speedrun_leaderboard
+
+    if table is not None:
+        indices = None
+        if country is not None:
+            indices = generation.speedrun_countries.rows(country.upper())
+        rows = with_player_names(table.rows(indices), generation.player_names)
 
-    if metadata_path.exists():
-        with open(metadata_path, "r", encoding="utf-8") as f:
-            metadata = json.load(f)
-            timestamp = metadata.get("timestamp", 0.0)
+    timestamp = generation.metadata_timestamp
 
-    return SpeedrunLeaderboardResponse(timestamp=timestamp, leaderboard=leaderboard)
+    if wants_ndjson(request, stream):
+        return ndjson_response({"timestamp": timestamp}, rows)
+
+    return SpeedrunLeaderboardResponse(
+        timestamp=timestamp,
+        leaderboard=[SpeedrunLeaderboardEntry(**row) for row in rows],
+    )
+
+
+@router.get(
+    "/country/stats",
+    summary="Get per-country leaderboard stats",
+    description="Returns, for every country, how many players it has on the monthly, speedrun, XP and Blitz boards and its best placement on each",
+    tags=["leaderboards"],
+    response_model=CountryStatsResponse,
+)
+@admission("archive")
+async def get_country_stats():
+    base_path = Path(STORAGE_PATH)
+    boards: Dict[str, Dict[str, Tuple[int, int]]] = {}
+
+    generation = await current_generation()
+    if generation.monthly_countries is not None:
+        boards["monthly"] = generation.monthly_countries.summary()
+    if generation.speedrun_countries is not None:
+        boards["speedrun"] = generation.speedrun_countries.summary()
+
+    for board, directory, kinds in [
+        ("xp", "xp_lb_archive", XP_LEADERBOARD_COLUMNS),
+        ("blitz", "blitz_lb_archive", BLITZ_LEADERBOARD_COLUMNS),
+    ]:
+        archive_path = latest_archive_path(base_path / directory, f"{board}_lb")
+        if archive_path is not None:
+            archive = await load_leaderboard_archive(archive_path, kinds)
+            if archive:
+                groups = await load_archive_country_groups(archive_path, archive)
+                boards[board] = groups.summary(archive.starts[-1], archive.ends[-1])
+
+    countries = sorted(
+        {country for summary in boards.values() for country in summary if country}
+    )
+    return CountryStatsResponse(
+        timestamp=generation.metadata_timestamp,
+        countries=[
+            CountryStats(
+                country=country,
+                **{
+                    board: CountryBoardStats(
+                        players=summary[country][0],
+                        best_placement=summary[country][1],
+                    )
+                    for board, summary in boards.items()
+                    if country in summary
+                },
+            )
+            for country in countries
+        ],
+    )
 
 
 @router.get(
@@ -331,14 +506,19 @@ async def get_speedrun_leaderboard():
     tags=["monthly leaderboard"],
     response_model=MonthlyLeaderboardResponse,
 )
-async def get_archived_monthly_leaderboard(year: int, month: int):
+@admission("archive")
+async def get_archived_monthly_leaderboard(
+    year: int,
+    month: int,
+    request: Request,
+    stream: bool = Query(False, description="Stream rows as NDJSON"),
+    country: Optional[str] = Query(None, description="Only rows of this country code"),
+):
     base_path = Path(STORAGE_PATH)
-    archive_path = (
+    archive_path = resolve_archive_path(
         base_path / f"monthly_lb_daily/archive/monthly_lb_{month:02d}_{year}.json"
     )
     levels_archive_path = base_path / "monthly_lb_monthly/levels_archive.json"
-    level_data_path = base_path / "github_data/level_data.csv"
-    account_data_path = base_path / "github_data/account_data.csv"
 
     if not archive_path.exists():
         raise HTTPException(
@@ -346,58 +526,37 @@ async def get_archived_monthly_leaderboard(year: int, month: int):
             detail=f"No monthly leaderboard archive found for {month}/{year}",
         )
 
-    with open(archive_path, "r", encoding="utf-8") as f:
-        archive = json.load(f)
+    archive_prefetcher.record("monthly_leaderboard", year, month)
+
+    archive = await load_leaderboard_archive(archive_path, MONTHLY_LEADERBOARD_COLUMNS)
 
     if not archive:
-        raise HTTPException(status_code=404, detail=f"Archive is empty")
-
-    latest_entry = max(archive, key=lambda x: x.get("timestamp", 0))
-
-    player_name_map = {}
-    if account_data_path.exists():
-        with open(account_data_path, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                player_name_map[row["account_id"]] = row["username"]
-
-    leaderboard = []
-    for entry in latest_entry.get("data", []):
-        player_uuid = entry["player_uuid"]
-        leaderboard.append(
-            LeaderboardEntry(
-                player_uuid=player_uuid,
-                player_name=player_name_map.get(player_uuid, player_uuid),
-                country=entry["country"],
-                score=int(entry["score"]),
-                wrs=int(entry["wrs"]),
-                average_place=float(entry["average_place"]),
-            )
-        )
+        raise HTTPException(status_code=404, detail="Archive is empty")
+
+    timestamp = archive.timestamps[-1]
+
+    player_name_map = await get_player_name_map()
+
+    rows = with_player_names(
+        await archive_snapshot_rows(archive_path, archive, len(archive) - 1, country),
+        player_name_map,
+    )
 
     levels = []
-    timestamp = latest_entry.get("timestamp", 0.0)
 
     if levels_archive_path.exists():
-        with open(levels_archive_path, "r", encoding="utf-8") as f:
-            levels_archive = json.load(f)
-            closest_levels_entry = find_closest_timestamp(levels_archive, timestamp)
-            level_uuids = closest_levels_entry.get("levels", [])
-
-        level_name_map = {}
-        if level_data_path.exists():
-            with open(level_data_path, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    level_name_map[row["level_uuid"]] = row["name"]
-
-        levels = [
-            LevelInfo(uuid=uuid, name=level_name_map.get(uuid, uuid))
-            for uuid in level_uuids
-        ]
+        levels_index = await load_levels_archive_index(levels_archive_path)
+        closest_levels_entry = levels_index.closest(timestamp)
+        if closest_levels_entry is not None:
+            levels = closest_levels_entry[2]
+
+    if wants_ndjson(request, stream):
+        return ndjson_response({"timestamp": timestamp, "levels": levels}, rows)
 
     return MonthlyLeaderboardResponse(
-        timestamp=timestamp, levels=levels, leaderboard=leaderboard
+        timestamp=timestamp,
+        levels=levels,
+        leaderboard=[LeaderboardEntry(**row) for row in rows],
     )
 
 
@@ -408,12 +567,12 @@ async def get_archived_monthly_leaderboard(year: int, month: int):
     tags=["monthly leaderboard"],
     response_model=MonthlyLevelsResponse,
 )
+@admission("archive")
 async def get_monthly_leaderboard_levels(year: int, month: int):
     base_path = Path(STORAGE_PATH)
     archive_path = base_path / "monthly_lb_monthly/levels_archive.json"
 
-    with open(archive_path, "r", encoding="utf-8") as f:
-        archive = json.load(f)
+    levels_index = await load_levels_archive_index(archive_path)
 
     month_start = datetime(year, month, 1).timestamp()
 
@@ -422,26 +581,31 @@ async def get_monthly_leaderboard_levels(year: int, month: int):
     else:
         month_end = datetime(year, month + 1, 1).timestamp()
 
-    for entry in archive:
-        timestamp = entry.get("timestamp", 0)
-        if month_start <= timestamp < month_end:
-            return MonthlyLevelsResponse(
-                year=year,
-                month=month,
-                timestamp=timestamp,
-                levels=entry.get("levels", []),
-            )
+    entry = levels_index.first_between(month_start, month_end)
+    if entry is not None:
+        return MonthlyLevelsResponse(
+            year=year, month=month, timestamp=entry[0], levels=entry[1]
+        )
 
     raise HTTPException(status_code=404, detail=f"No levels found for {year}/{month}")
 
 
-def find_closest_timestamp(
-    archive: List[Dict[str, Any]], target_timestamp: float
-) -> Dict[str, Any]:
-    closest_entry = min(
-        archive, key=lambda x: abs(x.get("timestamp", 0) - target_timestamp)
-    )
-    return closest_entry
+@router.get(
+    "/archive/xp_leaderboard/gainers",
+    summary="Get top XP gainers",
+    description="Ranks players by XP gained between the snapshots closest to the start and the end of a window",
+    tags=["archive"],
+    response_model=LeaderboardGainersResponse,
+)
+@admission("archive")
+async def get_xp_gainers(
+    window: str = Query("24h", description="Window length such as 90m, 24h or 7d"),
+    timestamp: Optional[float] = Query(
+        None, description="End of the window, defaults to now"
+    ),
+    limit: int = Query(100, ge=1, le=1000, description="Number of players"),
+):
+    return await leaderboard_gainers("xp_leaderboard", "xp", window, timestamp, limit)
 
 
 @router.get(
@@ -451,24 +615,39 @@ def find_closest_timestamp(
     tags=["archive"],
     response_model=XPLeaderboardResponse,
 )
-async def get_archived_xp_leaderboard(timestamp: float):
+@admission("archive")
+async def get_archived_xp_leaderboard(
+    timestamp: float,
+    request: Request,
+    stream: bool = Query(False, description="Stream rows as NDJSON"),
+    country: Optional[str] = Query(None, description="Only rows of this country code"),
+):
     dt = datetime.fromtimestamp(timestamp)
     base_path = Path(STORAGE_PATH)
-    archive_path = base_path / f"xp_lb_archive/xp_lb_{dt.month:02d}_{dt.year}.json"
+    archive_path = resolve_archive_path(
+        base_path / f"xp_lb_archive/xp_lb_{dt.month:02d}_{dt.year}.json"
+    )
 
     if not archive_path.exists():
         raise HTTPException(
             status_code=404, detail=f"No XP archive found for {dt.month}/{dt.year}"
         )
 
-    with open(archive_path, "r", encoding="utf-8") as f:
-        archive = json.load(f)
+    archive_prefetcher.record("xp_leaderboard", dt.year, dt.month)
 
-    closest_entry = find_closest_timestamp(archive, timestamp)
+    archive = await load_leaderboard_archive(archive_path, XP_LEADERBOARD_COLUMNS)
 
-    return XPLeaderboardResponse(
-        timestamp=closest_entry["timestamp"], data=closest_entry["data"]
-    )
+    if not archive:
+        raise HTTPException(status_code=404, detail="Archive is empty")
+
+    index = archive.closest_index(timestamp)
+    closest_timestamp = archive.timestamps[index]
+    rows = await archive_snapshot_rows(archive_path, archive, index, country)
+
+    if wants_ndjson(request, stream):
+        return ndjson_response({"timestamp": closest_timestamp}, rows)
+
+    return XPLeaderboardResponse(timestamp=closest_timestamp, data=list(rows))
 
 
 @router.get(
@@ -478,64 +657,88 @@ async def get_archived_xp_leaderboard(timestamp: float):
     tags=["archive"],
     response_model=MonthUptimeResponse,
 )
+@admission("uptime")
 async def get_xp_leaderboard_uptime(year: int, month: int):
     base_path = Path(STORAGE_PATH)
-    archive_path = base_path / f"xp_lb_archive/xp_lb_{month:02d}_{year}.json"
+    archive_path = resolve_archive_path(
+        base_path / UPTIME_ARCHIVES["xp_leaderboard"].format(year=year, month=month)
+    )
 
     if not archive_path.exists():
         raise HTTPException(
             status_code=404, detail=f"No XP archive found for {month}/{year}"
         )
 
-    with open(archive_path, "r", encoding="utf-8") as f:
-        archive = json.load(f)
+    archive_prefetcher.record("uptime:xp_leaderboard", year, month)
 
-    next_month = (
-        datetime(year, month + 1, 1, tzinfo=timezone.utc)
-        if month < 12
-        else datetime(year + 1, 1, 1, tzinfo=timezone.utc)
-    )
-    days_in_month = (next_month - timedelta(days=1)).day
+    coverage = await load_archive_coverage(archive_path)
 
-    # month_start = datetime(year, month, 1, tzinfo=timezone.utc)
-    month_end = (
-        datetime(year, month + 1, 1, tzinfo=timezone.utc)
-        if month < 12
-        else datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+    return MonthUptimeResponse(
+        year=year, month=month, days=month_day_statuses(coverage, year, month, True)
     )
 
-    days = []
-    for day in range(1, days_in_month + 1):
-        day_start = datetime(year, month, day, tzinfo=timezone.utc)
-        day_end = (
-            datetime(year, month, day + 1, tzinfo=timezone.utc)
-            if day < days_in_month
-            else month_end
-        )
 
-        day_start_ts = day_start.timestamp()
-        day_end_ts = day_end.timestamp()
+@router.get(
+    "/archive/uptime/{year}",
+    summary="Get uptime heatmap for a year",
+    description="Returns the UTC hours with data for every day of a year, for the XP leaderboard, Blitz leaderboard and quests archives",
+    tags=["archive"],
+    response_model=YearUptimeResponse,
+)
+@admission("uptime")
+async def get_year_uptime(year: int):
+    if not date.min.year <= year <= date.max.year:
+        raise HTTPException(status_code=400, detail=f"Invalid year {year}")
 
-        entries_in_day = [
-            e for e in archive if day_start_ts <= e.get("timestamp", 0) < day_end_ts
-        ]
+    base_path = Path(STORAGE_PATH)
 
-        if not entries_in_day:
-            status = "no data"
-        else:
-            hours_with_data = set()
-            for entry in entries_in_day:
-                dt = datetime.fromtimestamp(entry.get("timestamp", 0), timezone.utc)
-                hours_with_data.add(dt.hour)
+    datasets = {}
+    for dataset, archive_template in UPTIME_ARCHIVES.items():
+        year_coverage: Dict[date, int] = {}
+        for month in range(1, 13):
+            archive_path = resolve_archive_path(
+                base_path / archive_template.format(year=year, month=month)
+            )
+            if not archive_path.exists():
+                continue
+            coverage = await load_archive_coverage(archive_path)
+            for day, mask in coverage.items():
+                if day.year == year:
+                    year_coverage[day] = year_coverage.get(day, 0) | mask
+
+        day = date(year, 1, 1)
+        days = []
+        while day.year == year:
+            mask = year_coverage.get(day, 0)
+            days.append(
+                DayCoverage(
+                    date=day, hours=[hour for hour in range(24) if mask >> hour & 1]
+                )
+            )
+            day += timedelta(days=1)
+        datasets[dataset] = days
 
-            if len(hours_with_data) == 24:
-                status = "full data"
-            else:
-                status = "partially available"
+    return YearUptimeResponse(year=year, datasets=datasets)
 
-        days.append(DayStatus(day=day, status=status))
 
-    return MonthUptimeResponse(year=year, month=month, days=days)
+@router.get(
+    "/archive/blitz_leaderboard/gainers",
+    summary="Get top Blitz gainers",
+    description="Ranks players by BSR gained between the snapshots closest to the start and the end of a window",
+    tags=["archive"],
+    response_model=LeaderboardGainersResponse,
+)
+@admission("archive")
+async def get_blitz_gainers(
+    window: str = Query("24h", description="Window length such as 90m, 24h or 7d"),
+    timestamp: Optional[float] = Query(
+        None, description="End of the window, defaults to now"
+    ),
+    limit: int = Query(100, ge=1, le=1000, description="Number of players"),
+):
+    return await leaderboard_gainers(
+        "blitz_leaderboard", "bsr", window, timestamp, limit
+    )
 
 
 @router.get(
@@ -545,10 +748,16 @@ async def get_xp_leaderboard_uptime(year: int, month: int):
     tags=["archive"],
     response_model=BlitzLeaderboardResponse,
 )
-async def get_archived_blitz_leaderboard(timestamp: float):
+@admission("archive")
+async def get_archived_blitz_leaderboard(
+    timestamp: float,
+    request: Request,
+    stream: bool = Query(False, description="Stream rows as NDJSON"),
+    country: Optional[str] = Query(None, description="Only rows of this country code"),
+):
     dt = datetime.fromtimestamp(timestamp)
     base_path = Path(STORAGE_PATH)
-    archive_path = (
+    archive_path = resolve_archive_path(
         base_path / f"blitz_lb_archive/blitz_lb_{dt.month:02d}_{dt.year}.json"
     )
 
@@ -557,14 +766,21 @@ async def get_archived_blitz_leaderboard(timestamp: float):
             status_code=404, detail=f"No blitz archive found for {dt.month}/{dt.year}"
         )
 
-    with open(archive_path, "r", encoding="utf-8") as f:
-        archive = json.load(f)
+    archive_prefetcher.record("blitz_leaderboard", dt.year, dt.month)
 
-    closest_entry = find_closest_timestamp(archive, timestamp)
+    archive = await load_leaderboard_archive(archive_path, BLITZ_LEADERBOARD_COLUMNS)
 
-    return BlitzLeaderboardResponse(
-        timestamp=closest_entry["timestamp"], data=closest_entry["data"]
-    )
+    if not archive:
+        raise HTTPException(status_code=404, detail="Archive is empty")
+
+    index = archive.closest_index(timestamp)
+    closest_timestamp = archive.timestamps[index]
+    rows = await archive_snapshot_rows(archive_path, archive, index, country)
+
+    if wants_ndjson(request, stream):
+        return ndjson_response({"timestamp": closest_timestamp}, rows)
+
+    return BlitzLeaderboardResponse(timestamp=closest_timestamp, data=list(rows))
 
 
 @router.get(
@@ -574,65 +790,26 @@ async def get_archived_blitz_leaderboard(timestamp: float):
     tags=["archive"],
     response_model=MonthUptimeResponse,
 )
+@admission("uptime")
 async def get_blitz_leaderboard_uptime(year: int, month: int):
     base_path = Path(STORAGE_PATH)
-    archive_path = base_path / f"blitz_lb_archive/blitz_lb_{month:02d}_{year}.json"
+    archive_path = resolve_archive_path(
+        base_path / UPTIME_ARCHIVES["blitz_leaderboard"].format(year=year, month=month)
+    )
 
     if not archive_path.exists():
         raise HTTPException(
             status_code=404, detail=f"No blitz archive found for {month}/{year}"
         )
 
-    with open(archive_path, "r", encoding="utf-8") as f:
-        archive = json.load(f)
+    archive_prefetcher.record("uptime:blitz_leaderboard", year, month)
 
-    next_month = (
-        datetime(year, month + 1, 1, tzinfo=timezone.utc)
-        if month < 12
-        else datetime(year + 1, 1, 1, tzinfo=timezone.utc)
-    )
-    days_in_month = (next_month - timedelta(days=1)).day
+    coverage = await load_archive_coverage(archive_path)
 
-    # month_start = datetime(year, month, 1, tzinfo=timezone.utc)
-    month_end = (
-        datetime(year, month + 1, 1, tzinfo=timezone.utc)
-        if month < 12
-        else datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+    return MonthUptimeResponse(
+        year=year, month=month, days=month_day_statuses(coverage, year, month, True)
     )
 
-    days = []
-    for day in range(1, days_in_month + 1):
-        day_start = datetime(year, month, day, tzinfo=timezone.utc)
-        day_end = (
-            datetime(year, month, day + 1, tzinfo=timezone.utc)
-            if day < days_in_month
-            else month_end
-        )
-
-        day_start_ts = day_start.timestamp()
-        day_end_ts = day_end.timestamp()
-
-        entries_in_day = [
-            e for e in archive if day_start_ts <= e.get("timestamp", 0) < day_end_ts
-        ]
-
-        if not entries_in_day:
-            status = "no data"
-        else:
-            hours_with_data = set()
-            for entry in entries_in_day:
-                dt = datetime.fromtimestamp(entry.get("timestamp", 0), timezone.utc)
-                hours_with_data.add(dt.hour)
-
-            if len(hours_with_data) == 24:
-                status = "full data"
-            else:
-                status = "partially available"
-
-        days.append(DayStatus(day=day, status=status))
-
-    return MonthUptimeResponse(year=year, month=month, days=days)
-
 
 @router.get(
     "/archive/quests/{year}/{month}/{day}",
@@ -641,37 +818,90 @@ async def get_blitz_leaderboard_uptime(year: int, month: int):
     tags=["archive"],
     response_model=QuestResponse,
 )
+@admission("archive")
 async def get_archived_quests(year: int, month: int, day: int):
     base_path = Path(STORAGE_PATH)
-    archive_path = base_path / f"quests_archive/quests_{month:02d}_{year}.json"
+    archive_path = resolve_archive_path(
+        base_path / f"quests_archive/quests_{month:02d}_{year}.json"
+    )
 
     if not archive_path.exists():
         raise HTTPException(
             status_code=404, detail=f"No quests archive found for {month}/{year}"
         )
 
-    with open(archive_path, "r", encoding="utf-8") as f:
-        archive = json.load(f)
-
-    day_start = datetime(year, month, day).timestamp()
-    day_end = (
-        datetime(year, month, day + 1).timestamp()
-        if day < 31
-        else (
-            datetime(year, month + 1, 1).timestamp()
-            if month < 12
-            else datetime(year + 1, 1, 1).timestamp()
+    archive_prefetcher.record("quests", year, month)
+
+    try:
+        day_start = datetime(year, month, day, tzinfo=timezone.utc)
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid date {year}/{month}/{day}"
         )
-    )
+    day_end = day_start + timedelta(days=1)
 
-    for entry in archive:
-        entry_timestamp = entry.get("timestamp", 0)
-        if day_start <= entry_timestamp < day_end:
-            return QuestResponse(timestamp=entry_timestamp, data=entry["data"])
+    quests_index = await load_archive_index(archive_path)
 
-    raise HTTPException(
-        status_code=404, detail=f"No quests found for {year}/{month}/{day}"
-    )
+    position = quests_index.first_between(day_start.timestamp(), day_end.timestamp())
+    if position is None:
+        raise HTTPException(
+            status_code=404, detail=f"No quests found for {year}/{month}/{day}"
+        )
+
+    entry = quests_index.read_entry(position)
+    return QuestResponse(timestamp=entry["timestamp"], data=entry["data"])
+
+
+@router.get(
+    "/archive/quests",
+    summary="Get archived quests for a date range",
+    description="Retrieves the quests entry for each day from start to end inclusive (UTC)",
+    tags=["archive"],
+    response_model=QuestRangeResponse,
+)
+@admission("archive")
+async def get_archived_quests_range(
+    start: date = Query(..., description="First day, YYYY-MM-DD"),
+    end: date = Query(..., description="Last day, YYYY-MM-DD"),
+):
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (end - start).days >= MAX_QUEST_RANGE_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Date range is limited to {MAX_QUEST_RANGE_DAYS} days",
+        )
+
+    base_path = Path(STORAGE_PATH)
+
+    quests = []
+    quests_index = None
+    day = start
+    while day <= end:
+        archive_path = resolve_archive_path(
+            base_path / f"quests_archive/quests_{day.month:02d}_{day.year}.json"
+        )
+        if quests_index is None or quests_index.path != archive_path:
+            quests_index = (
+                await load_archive_index(archive_path)
+                if archive_path.exists()
+                else ArchiveIndex.empty(archive_path)
+            )
+
+        day_start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+        day_end = day_start + timedelta(days=1)
+        position = quests_index.first_between(
+            day_start.timestamp(), day_end.timestamp()
+        )
+        if position is not None:
+            entry = quests_index.read_entry(position)
+            quests.append(
+                QuestResponse(timestamp=entry["timestamp"], data=entry["data"])
+            )
+
+        day += timedelta(days=1)
+
+    return QuestRangeResponse(start=start, end=end, quests=quests)
 
 
 @router.get(
@@ -681,51 +911,48 @@ async def get_archived_quests(year: int, month: int, day: int):
     tags=["archive"],
     response_model=MonthUptimeResponse,
 )
+@admission("uptime")
 async def get_quests_uptime(year: int, month: int):
     base_path = Path(STORAGE_PATH)
-    archive_path = base_path / f"quests_archive/quests_{month:02d}_{year}.json"
+    archive_path = resolve_archive_path(
+        base_path / UPTIME_ARCHIVES["quests"].format(year=year, month=month)
+    )
 
     if not archive_path.exists():
         raise HTTPException(
             status_code=404, detail=f"No quests archive found for {month}/{year}"
         )
 
-    with open(archive_path, "r", encoding="utf-8") as f:
-        archive = json.load(f)
+    archive_prefetcher.record("uptime:quests", year, month)
 
-    next_month = (
-        datetime(year, month + 1, 1, tzinfo=timezone.utc)
-        if month < 12
-        else datetime(year + 1, 1, 1, tzinfo=timezone.utc)
-    )
-    days_in_month = (next_month - timedelta(days=1)).day
+    coverage = await load_archive_coverage(archive_path)
 
-    month_end = (
-        datetime(year, month + 1, 1, tzinfo=timezone.utc)
-        if month < 12
-        else datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+    return MonthUptimeResponse(
+        year=year, month=month, days=month_day_statuses(coverage, year, month, False)
     )
 
-    days = []
-    for day in range(1, days_in_month + 1):
-        day_start = datetime(year, month, day, tzinfo=timezone.utc)
-        day_end = (
-            datetime(year, month, day + 1, tzinfo=timezone.utc)
-            if day < days_in_month
-            else month_end
-        )
 
-        day_start_ts = day_start.timestamp()
-        day_end_ts = day_end.timestamp()
+def xp_history(player_changes: PlayerChanges, uuid: str) -> List[PlayerXPHistoryPoint]:
+    return [
+        PlayerXPHistoryPoint(timestamp=entry["timestamp"], xp=entry["xp"])
+        for entry in player_changes.history("xp_changes", uuid)
+    ]
 
-        has_data = any(
-            day_start_ts <= entry.get("timestamp", 0) < day_end_ts for entry in archive
-        )
 
-        status = "full data" if has_data else "no data"
-        days.append(DayStatus(day=day, status=status))
+def blitz_history(
+    player_changes: PlayerChanges, uuid: str
+) -> List[PlayerBlitzHistoryPoint]:
+    return [
+        PlayerBlitzHistoryPoint(timestamp=entry["timestamp"], bsr=entry["bsr"])
+        for entry in player_changes.history("blitz_changes", uuid)
+    ]
 
-    return MonthUptimeResponse(year=year, month=month, days=days)
+
+def username_changes(player_changes: PlayerChanges, uuid: str) -> List[UsernameChange]:
+    return [
+        UsernameChange(timestamp=entry["timestamp"], new_name=entry["name"])
+        for entry in player_changes.history("usernames", uuid)
+    ]
 
 
 @router.get(
@@ -736,26 +963,11 @@ async def get_quests_uptime(year: int, month: int):
     response_model=PlayerXPHistoryResponse,
 )
 async def get_player_xp_history(uuid: str):
-    base_path = Path(STORAGE_PATH)
-    player_data_path = base_path / "player_data/player_changes.json"
+    player_changes = await get_player_changes()
 
-    if not player_data_path.exists():
-        return PlayerXPHistoryResponse(player_uuid=uuid, history=[])
-
-    with open(player_data_path, "r", encoding="utf-8") as f:
-        player_data = json.load(f)
-
-    player = player_data.get(uuid)
-    if not player:
-        return PlayerXPHistoryResponse(player_uuid=uuid, history=[])
-
-    xp_changes = player.get("xp_changes", [])
-    history = [
-        PlayerXPHistoryPoint(timestamp=entry["timestamp"], xp=entry["xp"])
-        for entry in xp_changes
-    ]
-
-    return PlayerXPHistoryResponse(player_uuid=uuid, history=history)
+    return PlayerXPHistoryResponse(
+        player_uuid=uuid, history=xp_history(player_changes, uuid)
+    )
 
 
 @router.get(
@@ -766,26 +978,11 @@ async def get_player_xp_history(uuid: str):
     response_model=PlayerBlitzHistoryResponse,
 )
 async def get_player_blitz_history(uuid: str):
-    base_path = Path(STORAGE_PATH)
-    player_data_path = base_path / "player_data/player_changes.json"
-
-    if not player_data_path.exists():
-        return PlayerBlitzHistoryResponse(player_uuid=uuid, history=[])
-
-    with open(player_data_path, "r", encoding="utf-8") as f:
-        player_data = json.load(f)
+    player_changes = await get_player_changes()
 
-    player = player_data.get(uuid)
-    if not player:
-        return PlayerBlitzHistoryResponse(player_uuid=uuid, history=[])
-
-    blitz_changes = player.get("blitz_changes", [])
-    history = [
-        PlayerBlitzHistoryPoint(timestamp=entry["timestamp"], bsr=entry["bsr"])
-        for entry in blitz_changes
-    ]
-
-    return PlayerBlitzHistoryResponse(player_uuid=uuid, history=history)
+    return PlayerBlitzHistoryResponse(
+        player_uuid=uuid, history=blitz_history(player_changes, uuid)
+    )
 
 
 @router.get(
@@ -795,7 +992,12 @@ async def get_player_blitz_history(uuid: str):
     tags=["player"],
     response_model=PlayerLeaderboardPlacementsResponse,
 )
+@admission("archive")
 async def get_player_leaderboard_placements(uuid: str):
+    return await find_leaderboard_placements(uuid)
+
+
+async def find_leaderboard_placements(uuid: str) -> PlayerLeaderboardPlacementsResponse:
     base_path = Path(STORAGE_PATH)
 
     monthly_placement = LeaderboardPlacement(
@@ -806,53 +1008,40 @@ async def get_player_leaderboard_placements(uuid: str):
         timestamp=0.0, placement=None, not_found=True
     )
 
-    leaderboard_path = base_path / "monthly_lb_daily/leaderboard.csv"
-    metadata_path = base_path / "github_data/metadata.json"
+    generation = await current_generation()
 
-    if leaderboard_path.exists():
-        with open(leaderboard_path, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for index, row in enumerate(reader):
-                if row["player_uuid"] == uuid:
-                    monthly_placement = LeaderboardPlacement(
-                        timestamp=0.0, placement=index + 1, not_found=False
-                    )
-                    break
-
-    if metadata_path.exists():
-        with open(metadata_path, "r", encoding="utf-8") as f:
-            metadata = json.load(f)
-            monthly_placement.timestamp = metadata.get("timestamp", 0.0)
-
-    xp_archive_dir = base_path / "xp_lb_archive"
-    if xp_archive_dir.exists():
-        xp_files = sorted(xp_archive_dir.glob("xp_lb_*.json"))
-        if xp_files:
-            latest_xp_file = xp_files[-1]
-            with open(latest_xp_file, "r", encoding="utf-8") as f:
-                xp_archive = json.load(f)
-            latest_xp_entry = max(xp_archive, key=lambda x: x.get("timestamp", 0))
-            xp_placement.timestamp = latest_xp_entry.get("timestamp", 0.0)
-            for index, player in enumerate(latest_xp_entry.get("data", [])):
-                if player.get("acc") == uuid:
-                    xp_placement.placement = index + 1
-                    xp_placement.not_found = False
-                    break
-
-    blitz_archive_dir = base_path / "blitz_lb_archive"
-    if blitz_archive_dir.exists():
-        blitz_files = sorted(blitz_archive_dir.glob("blitz_lb_*.json"))
-        if blitz_files:
-            latest_blitz_file = blitz_files[-1]
-            with open(latest_blitz_file, "r", encoding="utf-8") as f:
-                blitz_archive = json.load(f)
-            latest_blitz_entry = max(blitz_archive, key=lambda x: x.get("timestamp", 0))
-            blitz_placement.timestamp = latest_blitz_entry.get("timestamp", 0.0)
-            for index, player in enumerate(latest_blitz_entry.get("data", [])):
-                if player.get("acc") == uuid:
-                    blitz_placement.placement = index + 1
-                    blitz_placement.not_found = False
-                    break
+    if generation.monthly_leaderboard is not None:
+        index = generation.monthly_leaderboard["player_uuid"].find(uuid)
+        if index != -1:
+            monthly_placement = LeaderboardPlacement(
+                timestamp=0.0, placement=index + 1, not_found=False
+            )
+
+    monthly_placement.timestamp = generation.metadata_timestamp
+
+    latest_xp_file = latest_archive_path(base_path / "xp_lb_archive", "xp_lb")
+    if latest_xp_file is not None:
+        xp_archive = await load_leaderboard_archive(
+            latest_xp_file, XP_LEADERBOARD_COLUMNS
+        )
+        if xp_archive:
+            xp_placement.timestamp, latest_xp_table = xp_archive.latest()
+            index = latest_xp_table["acc"].find(uuid)
+            if index != -1:
+                xp_placement.placement = index + 1
+                xp_placement.not_found = False
+
+    latest_blitz_file = latest_archive_path(base_path / "blitz_lb_archive", "blitz_lb")
+    if latest_blitz_file is not None:
+        blitz_archive = await load_leaderboard_archive(
+            latest_blitz_file, BLITZ_LEADERBOARD_COLUMNS
+        )
+        if blitz_archive:
+            blitz_placement.timestamp, latest_blitz_table = blitz_archive.latest()
+            index = latest_blitz_table["acc"].find(uuid)
+            if index != -1:
+                blitz_placement.placement = index + 1
+                blitz_placement.not_found = False
 
     return PlayerLeaderboardPlacementsResponse(
         player_uuid=uuid,
@@ -870,26 +1059,11 @@ async def get_player_leaderboard_placements(uuid: str):
     response_model=UsernameChangeHistoryResponse,
 )
 async def get_username_change_history(uuid: str):
-    base_path = Path(STORAGE_PATH)
-    player_data_path = base_path / "player_data/player_changes.json"
-
-    if not player_data_path.exists():
-        return UsernameChangeHistoryResponse(player_uuid=uuid, changes=[])
-
-    with open(player_data_path, "r", encoding="utf-8") as f:
-        player_data = json.load(f)
-
-    player = player_data.get(uuid)
-    if not player:
-        return UsernameChangeHistoryResponse(player_uuid=uuid, changes=[])
+    player_changes = await get_player_changes()
 
-    username_entries = player.get("usernames", [])
-    changes = [
-        UsernameChange(timestamp=entry["timestamp"], new_name=entry["name"])
-        for entry in username_entries
-    ]
-
-    return UsernameChangeHistoryResponse(player_uuid=uuid, changes=changes)
+    return UsernameChangeHistoryResponse(
+        player_uuid=uuid, changes=username_changes(player_changes, uuid)
+    )
 
 
 @router.get(
@@ -900,102 +1074,177 @@ async def get_username_change_history(uuid: str):
     response_model=GetUsernameResponse,
 )
 async def get_player_username(uuid: str):
-    base_path = Path(STORAGE_PATH)
-    account_data_path = base_path / "github_data/account_data.csv"
+    player_name_map = await get_player_name_map()
 
-    with open(account_data_path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row["account_id"] == uuid:
-                return GetUsernameResponse(player_uuid=uuid, username=row["username"])
+    if uuid in player_name_map:
+        return GetUsernameResponse(player_uuid=uuid, username=player_name_map[uuid])
 
     raise HTTPException(status_code=404, detail=f"Player {uuid} not found")
 
 
+PROFILE_SECTIONS = (
+    "username",
+    "xp_history",
+    "blitz_history",
+    "username_changes",
+    "placements",
+)
+
+
 @router.get(
-    "/comparison/get_scores_by_level",
-    summary="Compare player scores by level",
-    description="Retrieves latest scores for specified players grouped by level",
-    tags=["comparison"],
-    response_model=ComparisonResponse,
+    "/player/{uuid}/profile",
+    summary="Get player profile",
+    description="Returns the username, histories and leaderboard placements of a player in one response; `include` limits it to the listed sections",
+    tags=["player"],
+    response_model=PlayerProfileResponse,
+    response_model_exclude_none=True,
 )
-async def compare_scores_by_level(
-    player_uuids: List[str] = Query(..., description="List of player UUIDs to compare")
+async def get_player_profile(
+    uuid: str,
+    include: Optional[List[str]] = Query(
+        None, description=f"Sections to return, any of {', '.join(PROFILE_SECTIONS)}"
+    ),
 ):
-    base_path = Path(STORAGE_PATH)
-    score_data_path = base_path / "github_data/score_data.csv"
+    sections = set(include or PROFILE_SECTIONS)
+    unknown = sections.difference(PROFILE_SECTIONS)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown profile sections: {', '.join(sorted(unknown))}",
+        )
 
-    level_versions = {}
+    player_name_map = await get_player_name_map()
+    if uuid not in player_name_map:
+        raise HTTPException(status_code=404, detail=f"Player {uuid} not found")
 
-    with open(score_data_path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            level_uuid = row["level_uuid"]
-            level_version = int(row["level_version"])
+    profile = PlayerProfileResponse(player_uuid=uuid)
 
-            if (
-                level_uuid not in level_versions
-                or level_version > level_versions[level_uuid]
-            ):
-                level_versions[level_uuid] = level_version
+    if "username" in sections:
+        profile.username = player_name_map[uuid]
 
-    player_scores = {}
+    if sections.intersection(("xp_history", "blitz_history", "username_changes")):
+        player_changes = await get_player_changes()
+        if "xp_history" in sections:
+            profile.xp_history = xp_history(player_changes, uuid)
+        if "blitz_history" in sections:
+            profile.blitz_history = blitz_history(player_changes, uuid)
+        if "username_changes" in sections:
+            profile.username_changes = username_changes(player_changes, uuid)
 
-    with open(score_data_path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            player_uuid = row["account_ids"]
+    if "placements" in sections:
+        # Placements read the archives, so they share the archive routes' limit.
+        async with admission_gates["archive"].admit():
+            profile.placements = await find_leaderboard_placements(uuid)
 
-            if player_uuid not in player_uuids:
-                continue
+    return profile
 
-            level_uuid = row["level_uuid"]
-            level_version = int(row["level_version"])
 
-            if level_version != level_versions[level_uuid]:
-                continue
+@router.get(
+    "/player/search",
+    summary="Search players by username",
+    description="Returns players whose username starts with the query, ignoring case",
+    tags=["player"],
+    response_model=PlayerSearchResponse,
+)
+async def search_players(
+    q: str = Query(..., min_length=1, description="Username prefix"),
+    limit: int = Query(10, ge=1, le=100, description="Maximum number of matches"),
+):
+    account_data_path = Path(STORAGE_PATH) / "github_data/account_data.csv"
+
+    if not account_data_path.exists():
+        return PlayerSearchResponse(query=q, results=[])
+
+    username_index = await load_dataset(
+        "username_index", account_data_path, load_username_index
+    )
+
+    results = [
+        PlayerSearchResult(player_uuid=player_uuid, username=username)
+        for player_uuid, username in username_index.search(q, limit)
+    ]
 
-            score = int(row["value"])
-            value_type = int(row["value_type"])
-            timestamp = float(row["date"])
-            country = row["country"]
+    return PlayerSearchResponse(query=q, results=results)
 
-            key = (player_uuid, level_uuid, value_type)
 
-            if key not in player_scores or timestamp > player_scores[key]["timestamp"]:
-                player_scores[key] = {
-                    "score": score,
-                    "level_version": level_version,
-                    "timestamp": timestamp,
-                    "country": country,
-                }
+@router.get(
+    "/player/search/history",
+    summary="Find players by a past username",
+    description="Returns every player who has used the given name, with the time range they held it",
+    tags=["player"],
+    response_model=NameHistoryLookupResponse,
+)
+async def lookup_name_history(
+    name: str = Query(..., min_length=1, description="Current or former username"),
+):
+    player_data_path = Path(STORAGE_PATH) / "player_data/player_changes.json"
 
-    level_groups = {}
+    if not player_data_path.exists():
+        return NameHistoryLookupResponse(name=name, matches=[])
 
-    for (player_uuid, level_uuid, value_type), score_data in player_scores.items():
-        if level_uuid not in level_groups:
-            level_groups[level_uuid] = []
+    name_history = await load_dataset(
+        "name_history", player_data_path, load_name_history_index
+    )
+
+    matches = [
+        NameHistoryMatch(
+            player_uuid=entry["player_uuid"],
+            name=entry["name"],
+            valid_from=entry["valid_from"],
+            valid_until=(
+                None if math.isnan(entry["valid_until"]) else entry["valid_until"]
+            ),
+        )
+        for entry in name_history.lookup(name)
+    ]
+
+    return NameHistoryLookupResponse(name=name, matches=matches)
+
+
+@router.get(
+    "/comparison/get_scores_by_level",
+    summary="Compare player scores by level",
+    description="Retrieves latest scores for specified players grouped by level",
+    tags=["comparison"],
+    response_model=ComparisonResponse,
+)
+@admission("comparison")
+async def compare_scores_by_level(
+    player_uuids: List[str] = Query(..., description="List of player UUIDs to compare")
+):
+    base_path = Path(STORAGE_PATH)
+    score_data_path = base_path / "github_data/score_data.csv"
+
+    if STORAGE_BACKEND == "sqlite":
+        score_table = await load_dataset(
+            "score_index", score_data_path, load_sqlite_scores
+        )
+        score_groups = await asyncio.to_thread(
+            group_scores_by_level, score_table, player_uuids
+        )
+    else:
+        score_groups = await run_cpu_heavy(
+            group_scores_by_level_task, str(score_data_path), player_uuids
+        )
 
-        level_groups[level_uuid].append(
+    level_groups = {
+        level_uuid: [
             PlayerLevelScore(
-                player_uuid=player_uuid,
+                player_uuid=score_data["player_uuid"],
                 score=score_data["score"],
                 level_version=score_data["level_version"],
-                value_type=value_type,
+                value_type=score_data["value_type"],
                 timestamp=score_data["timestamp"],
                 country=score_data["country"],
             )
-        )
+            for score_data in scores
+        ]
+        for level_uuid, scores in score_groups.items()
+    }
 
     levels_sorted = sorted(level_groups.keys())
 
-    level_data_path = base_path / "github_data/level_data.csv"
-    level_name_map = {}
-    if level_data_path.exists():
-        with open(level_data_path, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                level_name_map[row["level_uuid"]] = row["name"]
+    level_name_map = await get_level_name_map()
 
     levels = [
         LevelScoresGroup(
@@ -1011,6 +1260,184 @@ async def compare_scores_by_level(
     return ComparisonResponse(players=player_uuids, levels=levels)
 
 
+@router.get(
+    "/level/{level_uuid}/top",
+    summary="Get the best scores on a level",
+    description="Returns the highest latest score of each player on a level version, best first",
+    tags=["levels"],
+    response_model=LevelTopResponse,
+)
+async def get_level_top_scores(
+    level_uuid: str,
+    value_type: int = Query(0, description="Score type to rank"),
+    version: Optional[int] = Query(
+        None, description="Level version, the newest one when omitted"
+    ),
+    limit: int = Query(100, ge=1, le=1000, description="Number of scores"),
+):
+    score_data_path = Path(STORAGE_PATH) / "github_data/score_data.csv"
+
+    if not score_data_path.exists():
+        raise HTTPException(status_code=404, detail="No score data found")
+
+    level_scores = await load_dataset(
+        "level_scores", score_data_path, load_level_score_table
+    )
+    group = level_scores.group(level_uuid, value_type, version)
+
+    if group is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No scores found for level {level_uuid} with value type {value_type}",
+        )
+
+    level_version, start, end = group
+    player_name_map = await get_player_name_map()
+    level_name_map = await get_level_name_map()
+
+    return LevelTopResponse(
+        level_uuid=level_uuid,
+        level_name=level_name_map.get(level_uuid, level_uuid),
+        level_version=level_version,
+        value_type=value_type,
+        scores=[
+            LevelTopScore(
+                rank=rank,
+                player_uuid=row["player_uuid"],
+                player_name=player_name_map.get(row["player_uuid"], row["player_uuid"]),
+                score=row["score"],
+                timestamp=row["timestamp"],
+                country=row["country"],
+            )
+            for rank, row in level_scores.top(start, end, limit)
+        ],
+    )
+
+
+@router.get(
+    "/level/{level_uuid}/rank",
+    summary="Rank scores against a level",
+    description="Returns the rank each score would hold among the latest scores on a level version, and the percentage of those scores it beats",
+    tags=["levels"],
+    response_model=LevelRankResponse,
+)
+async def get_level_score_ranks(
+    level_uuid: str,
+    score: List[int] = Query(..., description="Scores to rank, repeatable"),
+    value_type: int = Query(0, description="Score type to rank against"),
+    version: Optional[int] = Query(
+        None, description="Level version, the newest one when omitted"
+    ),
+):
+    if len(score) > MAX_RANK_BATCH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_RANK_BATCH} scores can be ranked at once",
+        )
+
+    score_data_path = Path(STORAGE_PATH) / "github_data/score_data.csv"
+
+    if not score_data_path.exists():
+        raise HTTPException(status_code=404, detail="No score data found")
+
+    level_scores = await load_dataset(
+        "level_scores", score_data_path, load_level_score_table
+    )
+    group = level_scores.group(level_uuid, value_type, version)
+
+    if group is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No scores found for level {level_uuid} with value type {value_type}",
+        )
+
+    level_version, start, end = group
+    total = end - start
+
+    return LevelRankResponse(
+        level_uuid=level_uuid,
+        level_version=level_version,
+        value_type=value_type,
+        total=total,
+        standings=[
+            ScoreStanding(
+                score=value,
+                rank=level_scores.rank(start, end, value),
+                percentile=100 * level_scores.below(start, end, value) / total,
+            )
+            for value in score
+        ],
+    )
+
+
+@router.get(
+    "/admin/admission",
+    summary="Get admission control metrics",
+    description="Returns concurrency limits, queue times and rejection counts per route group",
+    tags=["admin"],
+)
+async def get_admission_metrics():
+    return {name: gate.metrics() for name, gate in admission_gates.items()}
+
+
+@router.get(
+    "/admin/prefetch",
+    summary="Get archive prefetch metrics",
+    description="Returns how many adjacent archive months were preloaded, dropped under load or failed",
+    tags=["admin"],
+)
+async def get_prefetch_metrics():
+    return archive_prefetcher.metrics()
+
+
+def private_profile_dir() -> Path:
+    try:
+        return profile_dir()
+    except OSError:
+        raise HTTPException(status_code=503, detail="Profiles are not available")
+
+
+@router.get(
+    "/admin/profiles",
+    summary="List recent request profiles",
+    description="Returns the most recent sampled or requested profiles, newest first. Requires a valid X-Profile-Token header",
+    tags=["admin"],
+    response_model=List[ProfileSummary],
+)
+async def list_profiles(
+    request: Request,
+    limit: int = Query(50, ge=1, le=1000, description="Number of profiles"),
+):
+    require_profile_token(request)
+    directory = private_profile_dir()
+
+    profiles = []
+    for metadata_path in sorted(directory.glob("*.json"), reverse=True)[:limit]:
+        try:
+            profiles.append(json.loads(metadata_path.read_text()))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+@router.get(
+    "/admin/profiles/{profile_id}",
+    summary="Download a request profile",
+    description="Returns the collapsed stacks of a profile, one 'frame;frame;... count' line per stack, for flamegraph tools. Requires a valid X-Profile-Token header",
+    tags=["admin"],
+)
+def get_profile(profile_id: str, request: Request) -> FileResponse:
+    require_profile_token(request)
+    profile_path = private_profile_dir() / f"{profile_id}.folded"
+
+    if not PROFILE_ID_PATTERN.match(profile_id) or not profile_path.exists():
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+
+    return FileResponse(
+        path=profile_path, media_type="text/plain", filename=profile_path.name
+    )
+
+
 @router.get(
     "/data/get_players",
     summary="Get all players",
@@ -1022,4 +1449,94 @@ def get_players_csv() -> FileResponse:
     base_path = Path(STORAGE_PATH)
     file_path = base_path / "github_data/account_data.csv"
 
-    return FileResponse(path=file_path, filename="players.csv", media_type="text/csv")
\ No newline at end of file
+    return FileResponse(path=file_path, filename="players.csv", media_type="text/csv")
+
+
+EXPORT_DESCRIPTION = (
+    "Served as column tables: a 'LBCT' magic, format version and header size, "
+    "a JSON header describing every table and column, then 8-byte aligned "
+    "int64, float64 and dictionary-encoded utf-8 columns that can be mapped in place"
+)
+
+
+@router.get(
+    "/export/players",
+    summary="Export all players",
+    description=f"Exports every account id and username. {EXPORT_DESCRIPTION}",
+    tags=["data"],
+)
+@admission("archive")
+async def export_players() -> StreamingResponse:
+    account_data_path = Path(STORAGE_PATH) / "github_data/account_data.csv"
+
+    if not account_data_path.exists():
+        raise HTTPException(status_code=404, detail="No player data found")
+
+    return await export_shared_tables(
+        "account_names", account_data_path, build_account_tables, "players.lbct"
+    )
+
+
+@router.get(
+    "/export/scores",
+    summary="Export all scores",
+    description=f"Exports every row of the score data, on every level version, in the order the scores were recorded. {EXPORT_DESCRIPTION}",
+    tags=["data"],
+)
+@admission("archive")
+async def export_scores() -> StreamingResponse:
+    score_data_path = Path(STORAGE_PATH) / "github_data/score_data.csv"
+
+    if not score_data_path.exists():
+        raise HTTPException(status_code=404, detail="No score data found")
+
+    return await export_shared_tables(
+        "score_history", score_data_path, build_score_history_tables, "scores.lbct"
+    )
+
+
+@router.get(
+    "/export/latest_scores",
+    summary="Export the latest scores",
+    description=f"Exports only the latest score of every player on each level's newest version, sorted by player; see /export/scores for every score. {EXPORT_DESCRIPTION}",
+    tags=["data"],
+)
+@admission("archive")
+async def export_latest_scores() -> StreamingResponse:
+    score_data_path = Path(STORAGE_PATH) / "github_data/score_data.csv"
+
+    if not score_data_path.exists():
+        raise HTTPException(status_code=404, detail="No score data found")
+
+    return await export_shared_tables(
+        "score_index", score_data_path, build_score_tables, "latest_scores.lbct"
+    )
+
+
+@router.get(
+    "/export/archive/{board}/{year}/{month}",
+    summary="Export an archived leaderboard month",
+    description=f"Exports every snapshot of a monthly, XP or Blitz leaderboard archive as a snapshot index and one table of rows. {EXPORT_DESCRIPTION}",
+    tags=["data"],
+)
+@admission("archive")
+async def export_archive(board: str, year: int, month: int) -> StreamingResponse:
+    if board not in LEADERBOARD_ARCHIVES:
+        raise HTTPException(status_code=404, detail=f"Unknown archive {board}")
+
+    archive_template, kinds = LEADERBOARD_ARCHIVES[board]
+    archive_path = resolve_archive_path(
+        Path(STORAGE_PATH) / archive_template.format(year=year, month=month)
+    )
+
+    if not archive_path.exists():
+        raise HTTPException(
+            status_code=404, detail=f"No {board} archive found for {month}/{year}"
+        )
+
+    return await export_shared_tables(
+        shared_dataset_name("archive", archive_path),
+        archive_path,
+        lambda path: build_leaderboard_archive_tables(path, kinds),
+        f"{board}_{month:02d}_{year}.lbct",
+    )
@@ -0,0 +1,298 @@
+"""Response models of the API routes."""
+
+from datetime import date
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class LeaderboardEntry(BaseModel):
+    player_uuid: str
+    player_name: str
+    country: str
+    score: int
+    wrs: int
+    average_place: float
+
+
+class LevelInfo(BaseModel):
+    uuid: str
+    name: str
+
+
+class MonthlyLeaderboardResponse(BaseModel):
+    timestamp: float
+    levels: List[LevelInfo]
+    leaderboard: List[LeaderboardEntry]
+
+
+class MonthlyLevelsResponse(BaseModel):
+    year: int
+    month: int
+    timestamp: float
+    levels: List[str]
+
+
+class SpeedrunLeaderboardEntry(BaseModel):
+    player_uuid: str
+    player_name: str
+    country: str
+    score_1p_official: float
+    score_2p_official: float
+    score_1p_community: float
+    score_2p_community: float
+
+
+class SpeedrunLeaderboardResponse(BaseModel):
+    timestamp: float
+    leaderboard: List[SpeedrunLeaderboardEntry]
+
+
+class CountryBoardStats(BaseModel):
+    players: int
+    best_placement: int
+
+
+class CountryStats(BaseModel):
+    country: str
+    monthly: Optional[CountryBoardStats] = None
+    speedrun: Optional[CountryBoardStats] = None
+    xp: Optional[CountryBoardStats] = None
+    blitz: Optional[CountryBoardStats] = None
+
+
+class CountryStatsResponse(BaseModel):
+    timestamp: float
+    countries: List[CountryStats]
+
+
+class XPLeaderboardEntry(BaseModel):
+    acc: str
+    name: str
+    xp: int
+
+
+class XPLeaderboardResponse(BaseModel):
+    timestamp: float
+    data: List[XPLeaderboardEntry]
+
+
+class DayStatus(BaseModel):
+    day: int
+    status: str
+
+
+class MonthUptimeResponse(BaseModel):
+    year: int
+    month: int
+    days: List[DayStatus]
+
+
+class DayCoverage(BaseModel):
+    date: date
+    hours: List[int]
+
+
+class YearUptimeResponse(BaseModel):
+    year: int
+    datasets: Dict[str, List[DayCoverage]]
+
+
+class BlitzLeaderboardEntry(BaseModel):
+    acc: str
+    name: str
+    bsr: int
+
+
+class BlitzLeaderboardResponse(BaseModel):
+    timestamp: float
+    data: List[BlitzLeaderboardEntry]
+
+
+class LeaderboardGainer(BaseModel):
+    acc: str
+    name: str
+    before: int
+    after: int
+    gain: int
+
+
+class LeaderboardGainersResponse(BaseModel):
+    start_timestamp: float
+    end_timestamp: float
+    gainers: List[LeaderboardGainer]
+
+
+class QuestLevel(BaseModel):
+    uuid: str
+    version: int
+    name: str
+
+
+class Quest(BaseModel):
+    kind: int
+    goal: int
+    levels: List[QuestLevel] = []
+    xp: int
+    enemy: Optional[str] = None
+
+
+class QuestData(BaseModel):
+    version: int
+    expiration: int
+    quests_id: int
+    quests: List[Quest]
+
+
+class QuestResponse(BaseModel):
+    timestamp: float
+    data: QuestData
+
+
+class QuestRangeResponse(BaseModel):
+    start: date
+    end: date
+    quests: List[QuestResponse]
+
+
+class PlayerXPHistoryPoint(BaseModel):
+    timestamp: float
+    xp: int
+
+
+class PlayerXPHistoryResponse(BaseModel):
+    player_uuid: str
+    history: List[PlayerXPHistoryPoint]
+
+
+class PlayerBlitzHistoryPoint(BaseModel):
+    timestamp: float
+    bsr: int
+
+
+class PlayerBlitzHistoryResponse(BaseModel):
+    player_uuid: str
+    history: List[PlayerBlitzHistoryPoint]
+
+
+class LeaderboardPlacement(BaseModel):
+    timestamp: float
+    placement: Optional[int]
+    not_found: bool
+
+
+class PlayerLeaderboardPlacementsResponse(BaseModel):
+    player_uuid: str
+    monthly_leaderboard: LeaderboardPlacement
+    xp_leaderboard: LeaderboardPlacement
+    blitz_leaderboard: LeaderboardPlacement
+
+
+class UsernameChange(BaseModel):
+    timestamp: float
+    new_name: str
+
+
+class UsernameChangeHistoryResponse(BaseModel):
+    player_uuid: str
+    changes: List[UsernameChange]
+
+
+class PlayerProfileResponse(BaseModel):
+    player_uuid: str
+    username: Optional[str] = None
+    xp_history: Optional[List[PlayerXPHistoryPoint]] = None
+    blitz_history: Optional[List[PlayerBlitzHistoryPoint]] = None
+    username_changes: Optional[List[UsernameChange]] = None
+    placements: Optional[PlayerLeaderboardPlacementsResponse] = None
+
+
+class GetUsernameResponse(BaseModel):
+    player_uuid: str
+    username: str
+
+
+class PlayerSearchResult(BaseModel):
+    player_uuid: str
+    username: str
+
+
+class PlayerSearchResponse(BaseModel):
+    query: str
+    results: List[PlayerSearchResult]
+
+
+class NameHistoryMatch(BaseModel):
+    player_uuid: str
+    name: str
+    valid_from: float
+    valid_until: Optional[float]
+
+
+class NameHistoryLookupResponse(BaseModel):
+    name: str
+    matches: List[NameHistoryMatch]
+
+
+class PlayerLevelScore(BaseModel):
+    player_uuid: str
+    score: int
+    level_version: int
+    value_type: int
+    timestamp: float
+    country: str
+
+
+class LevelScoresGroup(BaseModel):
+    level_uuid: str
+    level_name: str
+    scores: List[PlayerLevelScore]
+
+
+class LevelTopScore(BaseModel):
+    rank: int
+    player_uuid: str
+    player_name: str
+    score: int
+    timestamp: float
+    country: str
+
+
+class LevelTopResponse(BaseModel):
+    level_uuid: str
+    level_name: str
+    level_version: int
+    value_type: int
+    scores: List[LevelTopScore]
+
+
+class ScoreStanding(BaseModel):
+    score: int
+    rank: int
+    percentile: float
+
+
+class LevelRankResponse(BaseModel):
+    level_uuid: str
+    level_version: int
+    value_type: int
+    total: int
+    standings: List[ScoreStanding]
+
+
+class ComparisonResponse(BaseModel):
+    players: List[str]
+    levels: List[LevelScoresGroup]
+
+
+class ProfileSummary(BaseModel):
+    id: str
+    created: float
+    method: str
+    route: str
+    path: str
+    status_code: int
+    trigger: str
+    duration_ms: float
+    samples: int
+    interval_ms: float
@@ -0,0 +1,158 @@
+"""Loads archive months in the background while the server is idle."""
+
+import asyncio
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from .admission import admission_gates
+from .archives import (
+    LEADERBOARD_ARCHIVES,
+    UPTIME_ARCHIVES,
+    load_archive_coverage,
+    load_archive_index,
+    load_leaderboard_archive,
+)
+from .settings import (
+    ARCHIVE_PREFETCH,
+    PREFETCH_MAX_LOAD,
+    PREFETCH_MIN_AVAILABLE_MEMORY,
+    STORAGE_PATH,
+)
+from .sources import resolve_archive_path
+
+PREFETCH_QUEUE = 8
+PREFETCH_IDLE_CHECKS = 20
+PREFETCH_IDLE_INTERVAL = 0.05
+
+
+def under_resource_pressure() -> bool:
+    """True when background work would compete with requests for CPU or memory.
+
+    CPU is the one-minute load average per core against PREFETCH_MAX_LOAD;
+    memory is the available share of RAM against PREFETCH_MIN_AVAILABLE_MEMORY.
+    A check the platform cannot answer counts as no pressure.
+    """
+    try:
+        if os.getloadavg()[0] / (os.cpu_count() or 1) > PREFETCH_MAX_LOAD:
+            return True
+    except OSError:
+        pass
+
+    try:
+        with open("/proc/meminfo", "r", encoding="ascii") as f:
+            meminfo = {line.split(":")[0]: int(line.split()[1]) for line in f}
+        return (
+            meminfo["MemAvailable"]
+            < PREFETCH_MIN_AVAILABLE_MEMORY * meminfo["MemTotal"]
+        )
+    except (OSError, KeyError, ValueError, IndexError):
+        return False
+
+
+async def prefetch_archive(kind: str, year: int, month: int) -> bool:
+    """Loads what the `kind` routes need for one month, False if it has no archive."""
+    base_path = Path(STORAGE_PATH)
+    if kind.startswith("uptime:"):
+        template = UPTIME_ARCHIVES[kind.partition(":")[2]]
+    elif kind == "quests":
+        template = "quests_archive/quests_{month:02d}_{year}.json"
+    else:
+        template, kinds = LEADERBOARD_ARCHIVES[kind]
+
+    archive_path = resolve_archive_path(
+        base_path / template.format(year=year, month=month)
+    )
+    if not archive_path.exists():
+        return False
+
+    if kind.startswith("uptime:"):
+        await load_archive_coverage(archive_path)
+    elif kind == "quests":
+        await load_archive_index(archive_path)
+    else:
+        await load_leaderboard_archive(archive_path, kinds)
+    return True
+
+
+class ArchivePrefetcher:
+    """Preloads the archive months next to the ones being browsed.
+
+    Each access to a month queues its neighbour in the direction the client is
+    moving, or both neighbours for a first or repeated access. One background
+    task loads queued months one at a time, only once the archive routes are
+    idle and the machine is not under CPU or memory pressure; months that
+    cannot be loaded within about a second are dropped.
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.last_month: Dict[str, int] = {}
+        self.pending: "OrderedDict[Tuple[str, int], None]" = OrderedDict()
+        self.task: Optional["asyncio.Task[None]"] = None
+        self.prefetched = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def record(self, kind: str, year: int, month: int) -> None:
+        """Notes an access to a month of `kind` and queues its neighbours."""
+        if not self.enabled:
+            return
+
+        index = year * 12 + month - 1
+        previous = self.last_month.get(kind)
+        self.last_month[kind] = index
+        if previous is None or previous == index:
+            steps: Tuple[int, ...] = (1, -1)
+        else:
+            steps = (1,) if index > previous else (-1,)
+
+        for step in steps:
+            key = (kind, index + step)
+            self.pending[key] = None
+            self.pending.move_to_end(key)
+        while len(self.pending) > PREFETCH_QUEUE:
+            self.pending.popitem(last=False)
+            self.dropped += 1
+
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.run())
+
+    async def wait_for_idle(self) -> bool:
+        """Waits for the archive routes to go idle; False if they stay busy."""
+        gates = [admission_gates[group] for group in ("archive", "uptime")]
+        for _ in range(PREFETCH_IDLE_CHECKS):
+            if not any(gate.in_flight or gate.queued for gate in gates):
+                return not under_resource_pressure()
+            await asyncio.sleep(PREFETCH_IDLE_INTERVAL)
+        return False
+
+    async def run(self) -> None:
+        while self.pending:
+            if not await self.wait_for_idle():
+                self.dropped += len(self.pending)
+                self.pending.clear()
+                return
+
+            # Newest first: the latest access says most about the next one.
+            kind, index = self.pending.popitem()[0]
+            year, month = divmod(index, 12)
+            try:
+                if await prefetch_archive(kind, year, month + 1):
+                    self.prefetched += 1
+            except Exception:
+                # A month that fails here fails the same way when requested.
+                self.failed += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "pending": len(self.pending),
+            "prefetched": self.prefetched,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+archive_prefetcher = ArchivePrefetcher(ARCHIVE_PREFETCH)
@@ -0,0 +1,219 @@
+"""Sampling profiler for API requests.
+
+Requests are profiled at PROFILE_SAMPLE_RATE or on demand with the profile
+token, and each profile is saved as JSON under PROFILE_DIR.
+"""
+
+import asyncio
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from fastapi.routing import APIRoute
+
+from .settings import (
+    PROFILE_DIR,
+    PROFILE_INTERVAL,
+    PROFILE_KEEP,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_SECRET,
+)
+from .shared_cache import private_directory
+
+# Leaf frames of threads that are parked rather than working.
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+class SamplingProfiler:
+    """Samples the stacks of all busy threads from a background thread.
+
+    Stacks are kept in collapsed form ("thread;outer;...;leaf"), ready for
+    flamegraph tools. Work that other requests do on the same threads during
+    the profile shows up in it too.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="request-profiler", daemon=True
+        )
+
+    def __enter__(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            thread_names = {
+                thread.ident: thread.name for thread in threading.enumerate()
+            }
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                leaf = (
+                    os.path.basename(frame.f_code.co_filename),
+                    frame.f_code.co_name,
+                )
+                if leaf in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)})"
+                    )
+                    frame = frame.f_back
+                stack.append(thread_names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+def profile_token(expires: int, secret: str = PROFILE_SECRET) -> str:
+    """X-Profile-Token value that requests a profile until `expires` (unix time)."""
+    signature = hmac.new(secret.encode(), str(expires).encode(), "sha256")
+    return f"{expires}:{signature.hexdigest()}"
+
+
+def has_profile_token(request: Request) -> bool:
+    """True when the request carries an unexpired X-Profile-Token."""
+    token = request.headers.get("x-profile-token")
+    if not token or not PROFILE_SECRET:
+        return False
+    expires, _, _ = token.partition(":")
+    return (
+        expires.isdigit()
+        and int(expires) > time.time()
+        and hmac.compare_digest(token, profile_token(int(expires)))
+    )
+
+
+def require_profile_token(request: Request) -> None:
+    """Rejects requests for stored profiles that lack a valid profile token."""
+    if not has_profile_token(request):
+        raise HTTPException(
+            status_code=403, detail="A valid X-Profile-Token header is required"
+        )
+
+
+def profile_trigger(request: Request) -> Optional[str]:
+    """Why this request should be profiled, or None."""
+    if has_profile_token(request):
+        return "header"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]+-[A-Za-z0-9_.-]+$")
+
+
+def profile_dir() -> Path:
+    """PROFILE_DIR, created private to this user.
+
+    Profiles hold stack samples and the listing serves whatever metadata it
+    finds, so a directory that is not private is refused with an OSError.
+    """
+    return private_directory(Path(PROFILE_DIR))
+
+
+def save_profile(
+    request: Request,
+    route: APIRoute,
+    profiler: SamplingProfiler,
+    trigger: str,
+    duration: float,
+    status_code: int,
+) -> None:
+    """Writes the collapsed stacks and a metadata sidecar, keeping PROFILE_KEEP."""
+    directory = profile_dir()
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", route.path_format).strip("_") or "root"
+    profile_id = f"{time.time_ns()}-{request.method}-{slug}"
+    (directory / f"{profile_id}.folded").write_text(profiler.collapsed())
+    metadata = {
+        "id": profile_id,
+        "created": time.time(),
+        "method": request.method,
+        "route": route.path_format,
+        "path": request.url.path,
+        "status_code": status_code,
+        "trigger": trigger,
+        "duration_ms": duration * 1000,
+        "samples": profiler.samples,
+        "interval_ms": profiler.interval * 1000,
+    }
+    (directory / f"{profile_id}.json").write_text(json.dumps(metadata))
+
+    for stale_path in sorted(directory.glob("*.json"))[:-PROFILE_KEEP]:
+        stale_path.unlink(missing_ok=True)
+        stale_path.with_suffix(".folded").unlink(missing_ok=True)
+
+
+class ProfilingRoute(APIRoute):
+    """Route that runs a sampling profiler around selected requests.
+
+    A request is profiled when it carries a valid X-Profile-Token (see
+    `profile_token`) or is picked at PROFILE_SAMPLE_RATE. Streaming bodies are
+    produced after the handler returns and are not covered.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def profiled_handler(request: Request) -> Response:
+            trigger = profile_trigger(request)
+            if trigger is None:
+                return await handler(request)
+
+            status_code = 500
+            started = time.perf_counter()
+            profiler = SamplingProfiler(PROFILE_INTERVAL)
+            try:
+                with profiler:
+                    response = await handler(request)
+                status_code = response.status_code
+                return response
+            except HTTPException as exc:
+                status_code = exc.status_code
+                raise
+            finally:
+                duration = time.perf_counter() - started
+                try:
+                    await asyncio.to_thread(
+                        save_profile,
+                        request,
+                        self,
+                        profiler,
+                        trigger,
+                        duration,
+                        status_code,
+                    )
+                except OSError:
+                    pass
+
+        return profiled_handler
@@ -0,0 +1,39 @@
+"""Configuration read from the environment when the API is imported."""
+
+import hashlib
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STORAGE_PATH = os.getenv("STORAGE_PATH", "/storage")
+DATASET_CACHE_SIZE = int(os.getenv("DATASET_CACHE_SIZE", "128"))
+MAX_QUEST_RANGE_DAYS = int(os.getenv("MAX_QUEST_RANGE_DAYS", "366"))
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", "2"))
+CPU_POOL_QUEUE = int(os.getenv("CPU_POOL_QUEUE", "16"))
+ADMISSION_LIMITS = os.getenv("ADMISSION_LIMITS", "")
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2.0"))
+SHARED_CACHE_PATH = os.getenv(
+    "SHARED_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), f"learn_backend_cache-{os.getuid()}"),
+)
+# Scopes shared cache files to one data tree, so instances serving different
+# trees can share a cache directory without mapping each other's tables.
+STORAGE_KEY = hashlib.sha256(os.path.realpath(STORAGE_PATH).encode()).hexdigest()[:16]
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR",
+    os.path.join(tempfile.gettempdir(), f"learn_backend_profiles-{os.getuid()}"),
+)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SECRET = os.getenv("PROFILE_SECRET", "")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "files")
+SQLITE_PATH = os.getenv(
+    "SQLITE_PATH", os.path.join(SHARED_CACHE_PATH, f"github_data-{STORAGE_KEY}.sqlite3")
+)
+ARCHIVE_PREFETCH = os.getenv("ARCHIVE_PREFETCH", "0") == "1"
+PREFETCH_MAX_LOAD = float(os.getenv("PREFETCH_MAX_LOAD", "0.5"))
+PREFETCH_MIN_AVAILABLE_MEMORY = float(os.getenv("PREFETCH_MIN_AVAILABLE_MEMORY", "0.2"))
@@ -0,0 +1,137 @@
+"""Column tables shared between processes through SHARED_CACHE_PATH.
+
+The first process to need a dataset writes its tables for the current
+generation of the source file; every other process maps that file.
+"""
+
+import fcntl
+import io
+import mmap
+import os
+import tempfile
+from pathlib import Path
+from stat import S_ISDIR
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .datasets import file_generation
+from .settings import SHARED_CACHE_PATH, STORAGE_KEY, STORAGE_PATH
+from .tables import TABLE_FORMAT_VERSION, ColumnTable, read_tables, write_tables
+
+
+def private_directory(path: Path) -> Path:
+    """Creates `path` private to this user, or raises OSError if it is not.
+
+    A directory that another user owns or can write to is refused, since
+    they could have planted files in it or be able to read what is written.
+    """
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    stat = path.lstat()
+    if not S_ISDIR(stat.st_mode) or stat.st_uid != os.getuid() or stat.st_mode & 0o022:
+        raise OSError(f"Directory {path} is not private")
+    return path
+
+
+def shared_cache_dir() -> Path:
+    """The shared cache directory, created private to this user.
+
+    Mapped tables are trusted as they are, so a directory that is not private
+    is refused with an OSError and callers fall back to building in memory.
+    """
+    return private_directory(Path(SHARED_CACHE_PATH))
+
+
+def shared_file_prefix(dataset: str) -> str:
+    return f"{dataset}-{STORAGE_KEY}"
+
+
+def shared_table_path(dataset: str, path: Path) -> Path:
+    """Cache file for the current generation of `path`.
+
+    The name carries the data tree, the source fingerprint and the table
+    format version, so a restarted worker maps the file it finds and anything
+    else is rebuilt.
+    """
+    generation = file_generation(path)
+    return Path(SHARED_CACHE_PATH) / (
+        f"{shared_file_prefix(dataset)}-{generation[0]}-{generation[1]}"
+        f"-v{TABLE_FORMAT_VERSION}.tbl"
+    )
+
+
+def shared_dataset_name(kind: str, path: Path) -> str:
+    """Cache file prefix for a per-file dataset such as one archive month."""
+    return f"{kind}.{path.relative_to(STORAGE_PATH)}".replace(os.sep, ".")
+
+
+def attach_shared_tables(
+    dataset: str, path: Path, builder: Callable[[Path], Tuple[Dict, Dict]]
+) -> Tuple[Dict[str, Any], Dict[str, ColumnTable]]:
+    """Maps the tables built from `path` out of the cross-worker cache.
+
+    The first worker to miss a generation builds it under a file lock; every
+    worker then maps the same file read-only, so the parsed data is held once
+    in the page cache however many workers attach to it.
+    """
+    table_path = shared_table_path(dataset, path)
+    cache_dir = table_path.parent
+
+    try:
+        shared_cache_dir()
+        if not table_path.exists():
+            lock_path = cache_dir / f"{shared_file_prefix(dataset)}.lock"
+            with open(lock_path, "ab") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                if not table_path.exists():
+                    _build_shared_tables(dataset, path, table_path, builder)
+
+        with open(table_path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except OSError:
+        output = io.BytesIO()
+        write_tables(output, *builder(path))
+        buffer = output.getvalue()
+
+    return read_tables(buffer)
+
+
+def latest_shared_tables(
+    dataset: str,
+) -> Optional[Tuple[Dict[str, Any], Dict[str, ColumnTable]]]:
+    """Most recently built tables of `dataset`, whatever generation they are for."""
+    try:
+        table_paths = sorted(
+            shared_cache_dir().glob(
+                f"{shared_file_prefix(dataset)}-*-v{TABLE_FORMAT_VERSION}.tbl"
+            ),
+            key=lambda table_path: table_path.stat().st_mtime_ns,
+        )
+        if not table_paths:
+            return None
+        with open(table_paths[-1], "rb") as f:
+            return read_tables(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    except (OSError, ValueError):
+        return None
+
+
+def _build_shared_tables(
+    dataset: str,
+    path: Path,
+    table_path: Path,
+    builder: Callable[[Path], Tuple[Dict, Dict]],
+) -> None:
+    tables, meta = builder(path)
+
+    prefix = shared_file_prefix(dataset)
+    fd, tmp_path = tempfile.mkstemp(dir=table_path.parent, prefix=f".{prefix}-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write_tables(f, tables, meta)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, table_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    for stale_path in table_path.parent.glob(f"{prefix}-*.tbl"):
+        if stale_path != table_path:
+            stale_path.unlink(missing_ok=True)
@@ -0,0 +1,167 @@
+"""Parsers and readers for the files under STORAGE_PATH."""
+
+import csv
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from .tables import ColumnTable, StringPool, build_column_table
+
+
+def parse_json_file(path: Path) -> Any:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def archive_sidecar_path(path: Path) -> Path:
+    return path.with_name(path.name + ".idx")
+
+
+def resolve_archive_path(path: Path) -> Path:
+    """The NDJSON month written by archive_writer.py if there is one, else `path`."""
+    ndjson_path = path.with_suffix(".ndjson")
+    if archive_sidecar_path(ndjson_path).exists():
+        return ndjson_path
+    return path
+
+
+def latest_archive_path(directory: Path, prefix: str) -> Optional[Path]:
+    """Last archive month in `directory` by file name, in either format."""
+    stems = {path.stem for path in directory.glob(f"{prefix}_*.json")}
+    stems.update(
+        path.name[: -len(".ndjson.idx")]
+        for path in directory.glob(f"{prefix}_*.ndjson.idx")
+    )
+    if not stems:
+        return None
+    return resolve_archive_path(directory / f"{max(stems)}.json")
+
+
+def read_archive_sidecar(path: Path) -> Dict[str, Any]:
+    """Committed length, entry byte ranges and coverage of an NDJSON archive."""
+    with open(archive_sidecar_path(path), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_archive_entries(path: Path) -> List[Dict[str, Any]]:
+    """Entries of a JSON array archive or the committed entries of an NDJSON one."""
+    if path.suffix != ".ndjson":
+        return parse_json_file(path)
+
+    sidecar = read_archive_sidecar(path)
+    with open(path, "rb") as f:
+        data = f.read(sidecar["length"])
+    return [json.loads(data[start:end]) for _, start, end in sidecar["entries"]]
+
+
+def parse_account_names(path: Path) -> Dict[str, str]:
+    player_name_map = {}
+    with open(path, "r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            player_name_map[row["account_id"]] = row["username"]
+    return player_name_map
+
+
+def parse_level_names(path: Path) -> Dict[str, str]:
+    level_name_map = {}
+    with open(path, "r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            level_name_map[row["level_uuid"]] = row["name"]
+    return level_name_map
+
+
+def parse_metadata_timestamp(path: Path) -> float:
+    return parse_json_file(path).get("timestamp", 0.0)
+
+
+def parse_level_uuids(path: Path) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+MONTHLY_LEADERBOARD_COLUMNS = {
+    "player_uuid": "str",
+    "country": "str",
+    "score": "q",
+    "wrs": "q",
+    "average_place": "d",
+}
+SPEEDRUN_LEADERBOARD_COLUMNS = {
+    "player_uuid": "str",
+    "country": "str",
+    "score_1p_official": "d",
+    "score_2p_official": "d",
+    "score_1p_community": "d",
+    "score_2p_community": "d",
+}
+XP_LEADERBOARD_COLUMNS = {"acc": "str", "name": "str", "xp": "q"}
+BLITZ_LEADERBOARD_COLUMNS = {"acc": "str", "name": "str", "bsr": "q"}
+
+
+def parse_monthly_leaderboard(path: Path) -> ColumnTable:
+    with open(path, "r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        return build_column_table(reader, MONTHLY_LEADERBOARD_COLUMNS, StringPool())
+
+
+def parse_speedrun_leaderboard(path: Path) -> ColumnTable:
+    with open(path, "r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        rows = (
+            {
+                "player_uuid": row["player_uuid"],
+                "country": row.get("country", ""),
+                "score_1p_official": row.get("score_1p_official", 0.0),
+                "score_2p_official": row.get("score_2p_official", 0.0),
+                "score_1p_community": row.get("score_1p_community", 0.0),
+                "score_2p_community": row.get("score_2p_community", 0.0),
+            }
+            for row in reader
+        )
+        return build_column_table(rows, SPEEDRUN_LEADERBOARD_COLUMNS, StringPool())
+
+
+class CsvTailReader:
+    """Yields complete CSV rows appended after a byte offset.
+
+    `offset` advances past each row as it is read; a trailing line without a
+    newline is treated as still being written and left for the next read.
+    """
+
+    def __init__(self, path: Path, offset: int = 0):
+        self.path = path
+        self.offset = offset
+        self.rows_read = 0
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        with open(self.path, "rb") as f:
+            fieldnames = next(csv.reader([f.readline().decode("utf-8")]), [])
+            self.offset = max(self.offset, f.tell())
+            f.seek(self.offset)
+
+            def complete_lines() -> Iterator[str]:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        return
+                    self.offset += len(line)
+                    yield line.decode("utf-8")
+
+            for values in csv.reader(complete_lines()):
+                if values:
+                    self.rows_read += 1
+                    yield dict(zip(fieldnames, values))
+
+
+def tail_checkpoint(path: Path, offset: int) -> str:
+    """Digest of the header line and the bytes just before `offset`.
+
+    If it still matches later, the file has only been appended to since.
+    """
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(max(offset - 4096, 0))
+        tail = f.read(min(offset, 4096))
+    return hashlib.sha1(header + tail).hexdigest()
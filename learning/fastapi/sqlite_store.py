@@ -0,0 +1,202 @@
+"""The sqlite storage backend, used when STORAGE_BACKEND=sqlite.
+
+Source CSV files are ingested incrementally into one database. Score
+lookups query it instead of holding the data in memory; the name maps are
+read out of it once per generation of their source file.
+"""
+
+import sqlite3
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from .settings import SQLITE_PATH
+from .sources import CsvTailReader, tail_checkpoint
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    account_ids TEXT NOT NULL,
+    level_uuid TEXT NOT NULL,
+    level_version INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    value_type INTEGER NOT NULL,
+    date REAL NOT NULL,
+    country TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scores_player_level_type
+    ON scores (account_ids, level_uuid, value_type);
+CREATE INDEX IF NOT EXISTS scores_level_version ON scores (level_uuid, level_version);
+CREATE TABLE IF NOT EXISTS accounts (
+    account_id TEXT PRIMARY KEY,
+    username TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS levels (
+    level_uuid TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ingest_state (
+    source TEXT PRIMARY KEY,
+    byte_offset INTEGER NOT NULL,
+    row_count INTEGER NOT NULL,
+    checkpoint TEXT NOT NULL
+);
+"""
+
+SQLITE_SOURCES = {
+    "scores": {
+        "account_ids": str,
+        "level_uuid": str,
+        "level_version": int,
+        "value": int,
+        "value_type": int,
+        "date": float,
+        "country": str,
+    },
+    "accounts": {"account_id": str, "username": str},
+    "levels": {"level_uuid": str, "name": str},
+}
+
+_sqlite_connection: Optional[sqlite3.Connection] = None
+
+
+def connect_sqlite() -> sqlite3.Connection:
+    Path(SQLITE_PATH).parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    connection = sqlite3.connect(
+        SQLITE_PATH, timeout=30, isolation_level=None, check_same_thread=False
+    )
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SQLITE_SCHEMA)
+    return connection
+
+
+def get_sqlite_connection() -> sqlite3.Connection:
+    global _sqlite_connection
+    if _sqlite_connection is None:
+        _sqlite_connection = connect_sqlite()
+    return _sqlite_connection
+
+
+def ingest_sqlite_source(table: str, path: Path) -> None:
+    """Brings `table` up to date with its CSV source.
+
+    Rows appended since the last checkpoint are inserted; if the file was
+    truncated or rewritten the table is reloaded from scratch.
+    """
+    columns = SQLITE_SOURCES[table]
+    insert_sql = (
+        f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' for _ in columns)})"
+    )
+
+    connection = connect_sqlite()
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        state = connection.execute(
+            "SELECT byte_offset, row_count, checkpoint FROM ingest_state WHERE source = ?",
+            (table,),
+        ).fetchone()
+
+        offset, row_count = 0, 0
+        if (
+            state is not None
+            and state[0] <= path.stat().st_size
+            and tail_checkpoint(path, state[0]) == state[2]
+        ):
+            offset, row_count = state[0], state[1]
+        else:
+            connection.execute(f"DELETE FROM {table}")
+
+        reader = CsvTailReader(path, offset)
+        connection.executemany(
+            insert_sql,
+            (
+                tuple(convert(row[name]) for name, convert in columns.items())
+                for row in reader
+            ),
+        )
+        connection.execute(
+            "INSERT OR REPLACE INTO ingest_state VALUES (?, ?, ?, ?)",
+            (
+                table,
+                reader.offset,
+                row_count + reader.rows_read,
+                tail_checkpoint(path, reader.offset),
+            ),
+        )
+        connection.execute("COMMIT")
+    except BaseException:
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+
+
+def read_sqlite_names(table: str, key_column: str, value_column: str) -> Dict[str, str]:
+    """Every row of a name table as a plain dict, read in a single query.
+
+    Name maps are looked up once per row of a response, so they are copied
+    out rather than answered by a query per lookup on the event loop.
+    """
+    return dict(
+        get_sqlite_connection().execute(
+            f"SELECT {key_column}, {value_column} FROM {table}"
+        )
+    )
+
+
+class SqliteScoreTable:
+    """`ScoreTable` equivalent answered from the indexed SQLite scores table."""
+
+    def player_scores(self, player_uuid: str) -> Iterator[Dict[str, Any]]:
+        cursor = get_sqlite_connection().execute(
+            """
+            SELECT level_uuid, value_type, value, level_version, date, country
+            FROM scores AS s
+            WHERE account_ids = ?
+              AND level_version = (
+                  SELECT MAX(level_version) FROM scores WHERE level_uuid = s.level_uuid
+              )
+            ORDER BY rowid
+            """,
+            (player_uuid,),
+        )
+
+        latest = {}
+        for level_uuid, value_type, score, level_version, timestamp, country in cursor:
+            key = (level_uuid, value_type)
+            if key not in latest or timestamp > latest[key]["timestamp"]:
+                latest[key] = {
+                    "player_uuid": player_uuid,
+                    "level_uuid": level_uuid,
+                    "value_type": value_type,
+                    "score": score,
+                    "level_version": level_version,
+                    "timestamp": timestamp,
+                    "country": country,
+                }
+        return iter(latest.values())
+
+
+def load_sqlite_scores(path: Path) -> SqliteScoreTable:
+    ingest_sqlite_source("scores", path)
+    return SqliteScoreTable()
+
+
+def load_sqlite_player_countries(path: Path) -> Mapping:
+    ingest_sqlite_source("scores", path)
+    # SQLite takes the bare column from the row holding the MAX().
+    cursor = get_sqlite_connection().execute(
+        "SELECT account_ids, country, MAX(date) FROM scores GROUP BY account_ids"
+    )
+    return {player_uuid: country for player_uuid, country, _ in cursor}
+
+
+def load_sqlite_account_names(path: Path) -> Dict[str, str]:
+    ingest_sqlite_source("accounts", path)
+    return read_sqlite_names("accounts", "account_id", "username")
+
+
+def load_sqlite_level_names(path: Path) -> Dict[str, str]:
+    ingest_sqlite_source("levels", path)
+    return read_sqlite_names("levels", "level_uuid", "name")
@@ -0,0 +1,343 @@
+"""The LBCT column-table format.
+
+A table file holds named column tables: numeric columns as packed arrays
+and string columns as indexes into a dictionary of distinct values. Files
+are written once and mapped read-only, so every process reading a file
+shares its pages.
+"""
+
+import bisect
+import json
+import re
+import struct
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+TABLE_MAGIC = b"LBCT"
+TABLE_FORMAT_VERSION = 1
+TABLE_MEDIA_TYPE = "application/vnd.lbct"
+_TABLE_HEADER = struct.Struct("<4sIQ")
+
+
+class StringDictionary(Sequence):
+    """Distinct strings of a column, stored as an offsets array and a utf-8 blob."""
+
+    __slots__ = ("offsets", "blob")
+
+    def __init__(self, offsets: Sequence[int], blob: memoryview):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return str(self.blob[self.offsets[index] : self.offsets[index + 1]], "utf-8")
+
+    def code(self, value: str) -> Optional[int]:
+        """Index of `value`, found by searching the blob rather than decoding it."""
+        encoded = value.encode()
+        # A lookahead finds overlapping matches, one of which may be the entry.
+        for match in re.finditer(b"(?=" + re.escape(encoded) + b")", self.blob):
+            start, end = match.start(), match.start() + len(encoded)
+            # Empty entries share their start offset with the next one.
+            index = bisect.bisect_left(self.offsets, start)
+            while index < len(self) and self.offsets[index] == start:
+                if self.offsets[index + 1] == end:
+                    return index
+                index += 1
+        return None
+
+
+class StringColumn(Sequence):
+    """Dictionary-encoded string column: one integer code per row."""
+
+    __slots__ = ("codes", "values")
+
+    def __init__(self, codes: Sequence[int], values: Sequence[str]):
+        self.codes = codes
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index: int) -> str:
+        return self.values[self.codes[index]]
+
+    def find(self, value: str) -> int:
+        """Position of the first row holding `value`, or -1.
+
+        The value is looked up once in the dictionary and its code searched
+        for in the code array, so no row is decoded.
+        """
+        if isinstance(self.values, StringPool):
+            code = self.values.codes.get(value)
+        else:
+            code = self.values.code(value)
+        return -1 if code is None else find_code(self.codes, code)
+
+
+def find_code(codes: Sequence[int], code: int) -> int:
+    """Position of the first occurrence of `code` in a code array, or -1."""
+    if not isinstance(codes, memoryview):
+        try:
+            return codes.index(code)
+        except ValueError:
+            return -1
+    # A mapped array is searched as bytes, keeping only aligned matches.
+    needle = array(codes.format, [code]).tobytes()
+    for match in re.finditer(b"(?=" + re.escape(needle) + b")", codes.cast("B")):
+        if match.start() % codes.itemsize == 0:
+            return match.start() // codes.itemsize
+    return -1
+
+
+class ColumnTable:
+    """Typed, column-oriented rows backed by arrays or a read-only mmap."""
+
+    __slots__ = ("length", "columns")
+
+    def __init__(self, length: int, columns: Dict[str, Sequence]):
+        self.length = length
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, name: str) -> Sequence:
+        return self.columns[name]
+
+    def row(self, index: int) -> Dict[str, Any]:
+        return {name: column[index] for name, column in self.columns.items()}
+
+    def rows(self, indices: Optional[Iterable[int]] = None) -> Iterator[Dict[str, Any]]:
+        for index in range(self.length) if indices is None else indices:
+            yield self.row(index)
+
+    def slice(self, start: int, end: int) -> "ColumnTable":
+        """Rows `start` to `end` as a table sharing this table's storage."""
+        return ColumnTable(
+            end - start,
+            {
+                name: (
+                    StringColumn(column.codes[start:end], column.values)
+                    if isinstance(column, StringColumn)
+                    else column[start:end]
+                )
+                for name, column in self.columns.items()
+            },
+        )
+
+    def key_range(self, column: str, key: Any) -> range:
+        """Rows holding `key` in a column the table is sorted by."""
+        values = self.columns[column]
+        start = bisect.bisect_left(values, key)
+        return range(start, bisect.bisect_right(values, key, start))
+
+
+class TableMap(Mapping):
+    """Read-only mapping over a table sorted by its key column."""
+
+    def __init__(self, table: ColumnTable, key_column: str, value_column: str):
+        self.keys_column = table[key_column]
+        self.values_column = table[value_column]
+
+    def __getitem__(self, key: str) -> Any:
+        index = bisect.bisect_left(self.keys_column, key)
+        if index == len(self.keys_column) or self.keys_column[index] != key:
+            raise KeyError(key)
+        return self.values_column[index]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys_column)
+
+    def __len__(self) -> int:
+        return len(self.keys_column)
+
+
+class CountryGroups:
+    """Row indices of a table grouped by country, each group in table order."""
+
+    __slots__ = ("groups",)
+
+    def __init__(self, countries: Iterable[str]):
+        self.groups: Dict[str, array] = {}
+        for index, country in enumerate(countries):
+            group = self.groups.get(country)
+            if group is None:
+                group = self.groups[country] = array("q")
+            group.append(index)
+
+    def __contains__(self, country: str) -> bool:
+        return country in self.groups
+
+    def rows(
+        self, country: str, start: int = 0, end: Optional[int] = None
+    ) -> Sequence[int]:
+        """Indices of the rows of `country` that fall in [start, end)."""
+        group = self.groups.get(country)
+        if group is None:
+            return ()
+        low = bisect.bisect_left(group, start)
+        high = len(group) if end is None else bisect.bisect_left(group, end, low)
+        return memoryview(group)[low:high]
+
+    def summary(
+        self, start: int = 0, end: Optional[int] = None
+    ) -> Dict[str, Tuple[int, int]]:
+        """Row count and best placement per country within [start, end)."""
+        summary = {}
+        for country in self.groups:
+            rows = self.rows(country, start, end)
+            if len(rows):
+                summary[country] = (len(rows), rows[0] - start + 1)
+        return summary
+
+
+class StringPool(Sequence):
+    """Interned strings shared by the string columns of several tables."""
+
+    __slots__ = ("codes", "values")
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, index: int) -> str:
+        return self.values[index]
+
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(sys.intern(value))
+        return code
+
+
+def build_column_table(
+    rows: Iterable[Dict[str, Any]], kinds: Dict[str, str], pool: StringPool
+) -> ColumnTable:
+    """Packs rows into typed arrays, dictionary-encoding strings through `pool`."""
+    columns = {
+        name: array("I") if kind == "str" else array(kind)
+        for name, kind in kinds.items()
+    }
+    length = 0
+    for row in rows:
+        for name, kind in kinds.items():
+            value = row[name]
+            if kind == "str":
+                columns[name].append(pool.encode(value))
+            elif kind == "q":
+                columns[name].append(int(value))
+            else:
+                columns[name].append(float(value))
+        length += 1
+
+    return ColumnTable(
+        length,
+        {
+            name: StringColumn(column, pool) if kinds[name] == "str" else column
+            for name, column in columns.items()
+        },
+    )
+
+
+def encode_strings(values: Iterable[str]) -> Tuple[List[int], List[str]]:
+    codes_by_value: Dict[str, int] = {}
+    codes = [codes_by_value.setdefault(value, len(codes_by_value)) for value in values]
+    return codes, list(codes_by_value)
+
+
+def write_tables(
+    f: BinaryIO,
+    tables: Dict[str, Dict[str, Tuple[str, Sequence]]],
+    meta: Dict[str, Any],
+) -> None:
+    """Writes named tables as a JSON header followed by 8-byte aligned columns.
+
+    Column kinds are "q" (int64), "d" (float64) and "str" (dictionary-encoded
+    utf-8), so the file can be mapped and read in place by `read_tables`.
+    """
+    sections = []
+    size = 0
+
+    def add_section(data: bytes) -> List[int]:
+        nonlocal size
+        start = size
+        sections.append(data)
+        sections.append(b"\0" * (-len(data) % 8))
+        size += len(data) + (-len(data) % 8)
+        return [start, len(data)]
+
+    header_tables = {}
+    for table_name, columns in tables.items():
+        length = 0
+        header_columns = {}
+        for column_name, (kind, values) in columns.items():
+            length = len(values)
+            if kind == "str":
+                codes, dictionary = encode_strings(values)
+                encoded = [value.encode("utf-8") for value in dictionary]
+                offsets = array("q", [0])
+                for value in encoded:
+                    offsets.append(offsets[-1] + len(value))
+                header_columns[column_name] = {
+                    "kind": kind,
+                    "codes": add_section(array("I", codes).tobytes()),
+                    "offsets": add_section(offsets.tobytes()),
+                    "blob": add_section(b"".join(encoded)),
+                }
+            else:
+                header_columns[column_name] = {
+                    "kind": kind,
+                    "data": add_section(array(kind, values).tobytes()),
+                }
+        header_tables[table_name] = {"length": length, "columns": header_columns}
+
+    header = json.dumps(
+        {"byteorder": sys.byteorder, "meta": meta, "tables": header_tables}
+    ).encode("utf-8")
+    f.write(_TABLE_HEADER.pack(TABLE_MAGIC, TABLE_FORMAT_VERSION, len(header)))
+    f.write(header)
+    f.write(b"\0" * (-(_TABLE_HEADER.size + len(header)) % 8))
+    for section in sections:
+        f.write(section)
+
+
+def read_tables(buffer: Any) -> Tuple[Dict[str, Any], Dict[str, ColumnTable]]:
+    """Attaches to tables written by `write_tables` without copying the columns."""
+    view = memoryview(buffer)
+    magic, version, header_size = _TABLE_HEADER.unpack_from(view)
+    if magic != TABLE_MAGIC or version != TABLE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported table format {magic!r} v{version}")
+
+    header_end = _TABLE_HEADER.size + header_size
+    header = json.loads(bytes(view[_TABLE_HEADER.size : header_end]))
+    data_start = header_end + (-header_end % 8)
+
+    def section(spec: List[int], kind: str = "B") -> memoryview:
+        start = data_start + spec[0]
+        return view[start : start + spec[1]].cast(kind)
+
+    tables = {}
+    for table_name, table in header["tables"].items():
+        columns = {}
+        for column_name, column in table["columns"].items():
+            if column["kind"] == "str":
+                columns[column_name] = StringColumn(
+                    section(column["codes"], "I"),
+                    StringDictionary(
+                        section(column["offsets"], "q"), section(column["blob"])
+                    ),
+                )
+            else:
+                columns[column_name] = section(column["data"], column["kind"])
+        tables[table_name] = ColumnTable(table["length"], columns)
+
+    return header["meta"], tables